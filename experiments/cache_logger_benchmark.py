@@ -0,0 +1,51 @@
+import os
+import sys
+import timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.CacheLogger import CacheLogger
+
+"""
+Per-call cost of CacheLogger, for enabled and disabled levels, called from a few frames deep like the scrape loop.
+Console output goes to os.devnull so only the logger's own overhead is measured.
+"""
+
+
+def nested_call(depth, function):
+    if depth == 0:
+        return function()
+    return nested_call(depth - 1, function)
+
+
+def benchmark(logger, label, function, calls, depth):
+    seconds = min(timeit.repeat(lambda: nested_call(depth, function), number=calls, repeat=3))
+    print('{:<40} {:>10.2f} us/call'.format(label, seconds / calls * 1000000))
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(description='Microbenchmark CacheLogger per-call cost')
+    arg_parser.add_argument('--calls', type=int, default=2000)
+    arg_parser.add_argument('--depth', type=int, default=10, help='Stack depth the logger is called from')
+    args = arg_parser.parse_args()
+
+    # The console handler writes to sys.stderr, which is looked up when the logger is created
+    real_stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        quiet_logger = CacheLogger(caller='benchmark_quiet', cache_limit=5, debug=False)
+        debug_logger = CacheLogger(caller='benchmark_debug', cache_limit=5, debug=True)
+    finally:
+        sys.stderr = real_stderr
+
+    row = {'first': 'JOHN', 'last': 'SMITH', 'city': 'BELLINGHAM', 'state': 'WA'}
+    print('{} calls from {} frames deep'.format(args.calls, args.depth))
+    benchmark(quiet_logger, 'debug() with --debug off', lambda: quiet_logger.debug(
+        'Search: {} {}, {} {}'.format(row['first'], row['last'], row['city'], row['state'])), args.calls, args.depth)
+    benchmark(quiet_logger, 'info()', lambda: quiet_logger.info(
+        'Search: {} {}, {} {}'.format(row['first'], row['last'], row['city'], row['state'])), args.calls, args.depth)
+    benchmark(debug_logger, 'debug() with --debug on', lambda: debug_logger.debug(
+        'Search: {} {}, {} {}'.format(row['first'], row['last'], row['city'], row['state'])), args.calls, args.depth)
+    benchmark(quiet_logger, 'debug() lazy args with --debug off', lambda: quiet_logger.debug(
+        'Search: {} {}, {} {}', row['first'], row['last'], row['city'], row['state']), args.calls, args.depth)
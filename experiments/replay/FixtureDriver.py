@@ -0,0 +1,184 @@
+import re
+import time
+from os import path
+from urllib.parse import urljoin, urlparse
+
+from selenium.common.exceptions import NoSuchElementException
+
+from scrape.HtmlDocument import HtmlDocument
+
+"""
+Just enough of the Selenium WebDriver/WebElement API, backed by saved HTML pages, to run the real scraper parsing code
+offline. Every call that would be an HTTP round trip to chromedriver is counted, and can be given an artificial latency.
+"""
+
+CSS_SELECTOR_PATTERN = re.compile(r'^(?P<tag>[a-z0-9]*)'
+                                  r'(?:#(?P<id>[\w-]+))?'
+                                  r'(?:\.(?P<class>[\w-]+))?'
+                                  r'(?:\[(?P<attr>[\w-]+)=[\'"](?P<value>[^\'"]*)[\'"]\])?$')
+
+
+class _Searchable(object):
+
+    """ find_element(s)_by_* shared by the driver (whole page) and elements (their subtree) """
+
+    def _search_root(self):
+        raise NotImplementedError
+
+    def _wrap(self, node):
+        raise NotImplementedError
+
+    def _find_all(self, predicate):
+        self._round_trip()
+        return [self._wrap(node) for node in self._search_root().iter_descendants() if predicate(node)]
+
+    def _find_one(self, predicate, description):
+        matches = self._find_all(predicate)
+        if len(matches) == 0:
+            raise NoSuchElementException('Unable to locate element: {}'.format(description))
+        return matches[0]
+
+    def _round_trip(self):
+        raise NotImplementedError
+
+    def find_elements_by_class_name(self, name):
+        return self._find_all(lambda node: name in node.classes)
+
+    def find_element_by_class_name(self, name):
+        return self._find_one(lambda node: name in node.classes, '.{}'.format(name))
+
+    def find_element_by_id(self, element_id):
+        return self._find_one(lambda node: node.attrs.get('id') == element_id, '#{}'.format(element_id))
+
+    def find_element_by_link_text(self, link_text):
+        return self._find_one(lambda node: node.tag == 'a' and node.text == link_text, link_text)
+
+    def find_element_by_css_selector(self, selector):
+        match = CSS_SELECTOR_PATTERN.match(selector)
+        if match is None:
+            raise ValueError('Unsupported CSS selector for replay: {}'.format(selector))
+        parts = match.groupdict()
+
+        def predicate(node):
+            return (not parts['tag'] or node.tag == parts['tag']) and \
+                   (parts['id'] is None or node.attrs.get('id') == parts['id']) and \
+                   (parts['class'] is None or parts['class'] in node.classes) and \
+                   (parts['attr'] is None or node.attrs.get(parts['attr']) == parts['value'])
+
+        return self._find_one(predicate, selector)
+
+
+class FixtureElement(_Searchable):
+
+    def __init__(self, driver, node):
+        self._driver = driver
+        self._node = node
+
+    def _search_root(self):
+        return self._node
+
+    def _wrap(self, node):
+        return FixtureElement(self._driver, node)
+
+    def _round_trip(self):
+        self._driver.record_round_trip()
+
+    @property
+    def text(self):
+        self._round_trip()
+        return self._node.text
+
+    def get_attribute(self, name):
+        self._round_trip()
+        return self._node.attrs.get(name)
+
+    def is_displayed(self):
+        self._round_trip()
+        return True
+
+    def is_enabled(self):
+        self._round_trip()
+        return 'disabled' not in self._node.attrs
+
+    def click(self):
+        """ Links navigate to their href, resolved against the current URL """
+        self._round_trip()
+        href = self._node.attrs.get('href')
+        if href:
+            self._driver.navigate(urljoin(self._driver.current_url, href))
+
+
+class FixtureDriver(_Searchable):
+
+    """
+    :param routes: list of (URL path regex, fixture file name) pairs, checked in order
+    :param fixture_dir: directory holding the saved pages
+    :param round_trip_seconds: artificial latency added to every WebDriver call, to model chromedriver HTTP cost
+    """
+
+    def __init__(self, routes, fixture_dir, round_trip_seconds=0):
+        self._routes = [(re.compile(pattern), file_name) for pattern, file_name in routes]
+        self._fixture_dir = fixture_dir
+        self._round_trip_seconds = round_trip_seconds
+        self._pages = dict()
+        self._source = ''
+        self._document = None
+        self.current_url = None
+        self.round_trips = 0
+        self.page_loads = 0
+
+    def record_round_trip(self):
+        self.round_trips += 1
+        if self._round_trip_seconds:
+            time.sleep(self._round_trip_seconds)
+
+    def _round_trip(self):
+        self.record_round_trip()
+
+    def _search_root(self):
+        return self._document
+
+    @property
+    def page_source(self):
+        self._round_trip()
+        return self._source
+
+    def _wrap(self, node):
+        return FixtureElement(self, node)
+
+    def navigate(self, url):
+        url_path = urlparse(url).path
+        for pattern, file_name in self._routes:
+            if pattern.search(url_path):
+                break
+        else:
+            raise ValueError('No replay fixture routed for URL: {}'.format(url))
+
+        # Parse each saved page once; a page load in the benchmark should cost what Chrome's would, not ours
+        if file_name not in self._pages:
+            with open(path.join(self._fixture_dir, file_name), 'r', encoding='utf-8') as f:
+                source = f.read()
+            self._pages[file_name] = (source, HtmlDocument(source).root)
+
+        self._source, self._document = self._pages[file_name]
+        self.current_url = url
+        self.page_loads += 1
+
+    def get(self, url):
+        self._round_trip()
+        self.navigate(url)
+
+    def refresh(self):
+        self.get(self.current_url)
+
+    def get_cookies(self):
+        return list()
+
+    def add_cookie(self, cookie):
+        pass
+
+    def save_screenshot(self, file_path):
+        return False
+
+    def close(self):
+        pass
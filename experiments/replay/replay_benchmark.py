@@ -0,0 +1,174 @@
+import json
+import os
+import sys
+import timeit
+from argparse import ArgumentParser
+
+REPLAY_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(REPLAY_DIR)))
+sys.path.insert(0, REPLAY_DIR)
+
+from FixtureDriver import FixtureDriver
+from lib.CacheLogger import CacheLogger
+from scrape.FpsScraper import FpsScraper
+from scrape.ICScraper import ICScraper
+from scrape.Scraper import DOM_EXTRACTION_MODES
+
+"""
+Offline replay of the scraper parsing hot paths against saved pages, with no live site or browser.
+Checks the extracted matches and contacts against golden files, then times per-result and per-report parse cost
+and counts the WebDriver round trips and page loads each one makes.
+
+    python experiments/replay/replay_benchmark.py
+    python experiments/replay/replay_benchmark.py --round-trip-ms 3     # model chromedriver HTTP latency
+    python experiments/replay/replay_benchmark.py --update-golden       # after an intended parsing change
+"""
+
+FIXTURE_DIR = os.path.join(REPLAY_DIR, 'fixtures')
+GOLDEN_DIR = os.path.join(REPLAY_DIR, 'golden')
+
+SEARCH = {'first': 'JOHN', 'last': 'SMITH', 'city': 'BELLINGHAM', 'state': 'WA'}
+
+ROUTES = {'ic': [(r'/dashboard/search/person/', 'ic_search.html'),
+                 (r'/dashboard/report/1$', 'ic_report_1.html'),
+                 (r'/dashboard/report/2$', 'ic_report_2.html')],
+          'fps': [(r'/name/', 'fps_search.html'),
+                  (r'/report/1$', 'fps_report_1.html'),
+                  (r'/report/2$', 'fps_report_2.html')]}
+
+# Class name of one search result card on each site's search page
+RESULT_CLASSES = {'ic': 'result', 'fps': 'card-block'}
+
+
+def create_scraper(site, logger, round_trip_seconds, dom_extraction):
+    driver = FixtureDriver(routes=ROUTES[site], fixture_dir=FIXTURE_DIR, round_trip_seconds=round_trip_seconds)
+    scraper_class = ICScraper if site == 'ic' else FpsScraper
+    scraper = scraper_class(logger=logger, wait_range=(0, 0), chromedriver_path=None, use_proxy=False,
+                            driver=driver, dom_extraction=dom_extraction)
+    return scraper, driver
+
+
+def result_name(site, result):
+    if site == 'ic':
+        return result.get_attribute('data-full-name')
+    return result.text.split('\n')[0]
+
+
+def replay(site, scraper):
+    """ :return: golden-comparable dict of matched result names and extracted contact info """
+    matches = [result_name(site, result) for result in scraper.find(**SEARCH)]
+    contact_info = scraper.get_all_info(**SEARCH)
+    return {'search': SEARCH,
+            'matches': matches,
+            'contact_info': {'phone_numbers': sorted(contact_info['phone_numbers']),
+                             'email_addresses': sorted(contact_info['email_addresses'])}}
+
+
+def check_golden(site, label, replayed, update):
+    golden_file = os.path.join(GOLDEN_DIR, '{}.json'.format(site))
+    if update:
+        with open(golden_file, 'w') as f:
+            json.dump(replayed, f, indent=2)
+            f.write('\n')
+        print('{}: golden file updated: {}'.format(site, golden_file))
+        return True
+
+    with open(golden_file, 'r') as f:
+        golden = json.load(f)
+    if replayed != golden:
+        print('{} ({}): MISMATCH against {}'.format(site, label, golden_file))
+        print('  expected: {}'.format(json.dumps(golden, sort_keys=True)))
+        print('  replayed: {}'.format(json.dumps(replayed, sort_keys=True)))
+        return False
+    print('{} ({}): matches golden ({} matches, {} phone numbers, {} email addresses)'.format(
+        site, label, len(golden['matches']), len(golden['contact_info']['phone_numbers']),
+        len(golden['contact_info']['email_addresses'])))
+    return True
+
+
+def time_phase(driver, function, iterations):
+    """ :return: (seconds per call, WebDriver round trips per call, page loads per call) """
+    function()
+    round_trips_before = driver.round_trips
+    page_loads_before = driver.page_loads
+    seconds = min(timeit.repeat(function, number=iterations, repeat=3))
+    round_trips = (driver.round_trips - round_trips_before) / (iterations * 3)
+    page_loads = (driver.page_loads - page_loads_before) / (iterations * 3)
+    return seconds / iterations, round_trips, page_loads
+
+
+def benchmark(site, dom_extraction, scraper, driver, iterations):
+    rows = list()
+
+    # Search results: the filter runs over every card on the page
+    scraper.find(**SEARCH)
+    result_count = len(driver.find_elements_by_class_name(RESULT_CLASSES[site]))
+    seconds, round_trips, page_loads = time_phase(driver, lambda: scraper.find(**SEARCH), iterations)
+    rows.append(('find, per result', seconds / result_count, round_trips / result_count, page_loads / result_count))
+
+    if site == 'fps':
+        results = [result.text for result in driver.find_elements_by_class_name('card-block')]
+        seconds, round_trips, page_loads = time_phase(
+            driver, lambda: list(scraper._relevant_search_matches(results, **SEARCH)), iterations)
+        rows.append(('_relevant_search_matches, per result', seconds / len(results), round_trips / len(results),
+                     page_loads / len(results)))
+
+    # Reports: open the first match and extract its contacts
+    def open_first_report():
+        return scraper.get_info(search_result=scraper.find(**SEARCH)[0])
+
+    find_seconds, find_round_trips, find_page_loads = time_phase(driver, lambda: scraper.find(**SEARCH), iterations)
+    seconds, round_trips, page_loads = time_phase(driver, open_first_report, iterations)
+    rows.append(('get_info, per report', seconds - find_seconds, round_trips - find_round_trips,
+                 page_loads - find_page_loads))
+
+    if site == 'fps':
+        phone_lines = driver.find_element_by_class_name('detail-box-phone').text.split('\n')
+        seconds, round_trips, page_loads = time_phase(
+            driver, lambda: scraper._parse_phone_numbers(phone_text_list=phone_lines), iterations)
+        rows.append(('_parse_phone_numbers, per report', seconds, round_trips, page_loads))
+
+    # Whole searches: reloading the results page after every report, vs. opening reports by their captured URLs
+    for direct_reports, label in ((False, 'get_all_info, reloading results'), (True, 'get_all_info, report URLs')):
+        scraper._direct_reports = direct_reports
+        rows.append((label,) + time_phase(driver, lambda: scraper.get_all_info(**SEARCH), iterations))
+    scraper._direct_reports = True
+
+    print('{:<40}{:>14}{:>14}{:>14}'.format('{} ({})'.format(site, dom_extraction), 'us/call', 'round trips',
+                                            'page loads'))
+    for label, seconds, round_trips, page_loads in rows:
+        print('{:<40}{:>14.1f}{:>14.1f}{:>14.1f}'.format('  ' + label, seconds * 1000000, round_trips, page_loads))
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(description='Replay saved pages through the scraper parsers and benchmark them')
+    arg_parser.add_argument('--site', choices={'ic', 'fps'}, help='Only replay one site')
+    arg_parser.add_argument('--dom-extraction', choices=DOM_EXTRACTION_MODES,
+                            help='Only replay one extraction mode; by default both are replayed and compared')
+    arg_parser.add_argument('--iterations', type=int, default=200)
+    arg_parser.add_argument('--round-trip-ms', type=float, default=0,
+                            help='Artificial latency per WebDriver call, to model chromedriver HTTP round trips')
+    arg_parser.add_argument('--update-golden', default=False, action='store_true',
+                            help='Rewrite the golden files from this replay instead of checking against them')
+    args = arg_parser.parse_args()
+
+    # Scrapers log every match; keep the benchmark output readable
+    real_stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        replay_logger = CacheLogger(caller='replay', cache_limit=5, debug=False)
+    finally:
+        sys.stderr = real_stderr
+
+    all_match = True
+    for replay_site in sorted([args.site] if args.site else ROUTES.keys(), reverse=True):
+        for mode in [args.dom_extraction] if args.dom_extraction else DOM_EXTRACTION_MODES:
+            replay_scraper, replay_driver = create_scraper(replay_site, replay_logger, args.round_trip_ms / 1000, mode)
+            for direct_reports, label in ((True, mode), (False, '{}, reloading results'.format(mode))):
+                replay_scraper._direct_reports = direct_reports
+                all_match = check_golden(replay_site, label, replay(replay_site, replay_scraper),
+                                         args.update_golden) and all_match
+            replay_scraper._direct_reports = True
+            benchmark(replay_site, mode, replay_scraper, replay_driver, args.iterations)
+
+    sys.exit(0 if all_match else 1)
@@ -0,0 +1,100 @@
+import csv
+import os
+import time
+
+# Rows held in memory between writes to the temp file
+DEFAULT_BATCH_ROWS = 500
+
+# Maximum seconds between forced writes to disk of a file being appended to (also used by the scrape's RowJournal)
+FSYNC_INTERVAL_SECONDS = 30
+
+
+class AtomicCsvWriter(object):
+
+    """
+    csv.DictWriter-like output that only ever appears at its path complete. Rows are buffered and written in batches
+    to '<out_path>.partial' in the same directory, fsynced at most every fsync_interval seconds, and the temp file is
+    renamed over out_path when the writer is finished. A crash leaves the previous out_path (if any) untouched, rather
+    than a file with a torn last row for the S3 upload or a merge to pick up.
+
+    Use as a context manager. On an exception the rows written so far are discarded, unless keep_partial is set, in
+    which case they are finalized like a normal finish (e.g. a scrape cut short still delivers the rows it completed).
+    """
+
+    def __init__(self, out_path, fieldnames, batch_rows=DEFAULT_BATCH_ROWS, fsync_interval=FSYNC_INTERVAL_SECONDS,
+                 keep_partial=False):
+        self.path = out_path
+        self.temp_path = '{}.partial'.format(out_path)
+        self.fieldnames = list(fieldnames)
+        self.rows_written = 0
+        self._batch_rows = batch_rows
+        self._fsync_interval = fsync_interval
+        self._keep_partial = keep_partial
+        self._buffer = list()
+        self._file = None
+        self._writer = None
+        self._last_fsync = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None or self._keep_partial:
+            self.close()
+        else:
+            self.discard()
+
+    def open(self):
+        """ Start the temp file with the header row """
+        self._file = open(self.temp_path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        self._writer.writeheader()
+        self._last_fsync = time.time()
+        return self
+
+    def writerow(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self._batch_rows:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        """ Write buffered rows to the temp file; fsync if the interval has passed """
+        if len(self._buffer) > 0:
+            self._writer.writerows(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = list()
+        if time.time() - self._last_fsync >= self._fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.time()
+
+    def close(self):
+        """ Write out everything, then atomically replace out_path with the finished file """
+        if self._file is None or self._file.closed:
+            return
+        self.flush()
+        self._sync()
+        self._file.close()
+        os.replace(self.temp_path, self.path)
+
+        # Persist the rename itself
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def discard(self):
+        """ Drop the unfinished output, leaving out_path as it was """
+        self._buffer = list()
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if os.path.isfile(self.temp_path):
+            os.remove(self.temp_path)
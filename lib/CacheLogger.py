@@ -1,13 +1,26 @@
+from collections import deque
 from datetime import datetime
-import inspect
+import json
 import logging
+import sys
+import time
+
+# Cache-only level names map onto the standard levels for filtering
+RECORD_LEVELS = {'DEBUG': logging.DEBUG,
+                 'INFO': logging.INFO,
+                 'WARNING': logging.WARNING,
+                 'ERROR': logging.ERROR,
+                 'EXCEPTION': logging.ERROR,
+                 'TRACEBACK': logging.ERROR}
 
 
 class CacheLogger(object):
 
     """
     Wrapper for standard logger functionality that preserves a cache of recently logged messages, like a Tail
-    This cache can be retrieved for reporting.
+    This cache can be retrieved for reporting, as formatted lines, structured records, or JSON.
+    The cache is a fixed-size ring buffer: the oldest record is dropped once cache_limit is reached.
+    Messages may be passed as a str.format() template plus args, which are only formatted if the level is enabled.
     """
 
     def __init__(self, caller, cache_limit, debug=False):
@@ -15,7 +28,7 @@ class CacheLogger(object):
         self._debug = debug
         self._logger = self._create_logger()
         self._cache_limit = cache_limit
-        self.cache = list()
+        self._records = deque(maxlen=cache_limit)
 
     def _create_logger(self):
         """ General purpose logger with simple configuration """
@@ -35,51 +48,70 @@ class CacheLogger(object):
         new_logger.propagate = False
         return new_logger
 
-    def _prune_cache(self):
-        if len(self.cache) > self._cache_limit:
-            del self.cache[0]
+    def _cache_record(self, level_name, caller, message):
+        # A bounded deque drops the oldest record in O(1); appends are also safe from worker threads
+        self._records.append({'timestamp': time.time(),
+                              'level': level_name,
+                              'caller': caller,
+                              'message': str(message)})
 
     @staticmethod
-    def _augment_message(message, level):
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return '{} - {} - {}'.format(now, level, message)
-
-    def info(self, message):
-        caller = inspect.stack()[1].function
-        cache_message = self._augment_message(message, 'INFO')
-        self._logger.info(message, extra={'caller': caller})
-        self.cache.append(cache_message)
-        self._prune_cache()
-
-    def debug(self, message):
-        caller = inspect.stack()[1].function
-        cache_message = self._augment_message(message, 'DEBUG')
-        self._logger.debug(message, extra={'caller': caller})
-        if self._debug:
-            self.cache.append(cache_message)
-        self._prune_cache()
-
-    def warning(self, message):
-        caller = inspect.stack()[1].function
-        cache_message = self._augment_message(message, 'WARNING')
-        self._logger.warning(message, extra={'caller': caller})
-        self.cache.append(cache_message)
-        self._prune_cache()
-
-    def error(self, message):
-        caller = inspect.stack()[1].function
-        cache_message = self._augment_message(message, 'ERROR')
-        self._logger.error(message, extra={'caller': caller})
-        self.cache.append(cache_message)
-        self._prune_cache()
-
-    def exception(self, message):
-        caller = inspect.stack()[1].function
-        cache_message = self._augment_message(message, 'EXCEPTION')
-        self._logger.exception(message, extra={'caller': caller})
-        self.cache.append(cache_message)
-        self._prune_cache()
+    def _format_timestamp(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+    def records(self, min_level=logging.DEBUG):
+        """
+        :param min_level: Only return records at or above this level; a logging level int or name, e.g. 'WARNING'
+        :return: list of record dicts (timestamp, level, caller, message), oldest first
+        """
+        if isinstance(min_level, str):
+            min_level = RECORD_LEVELS[min_level.upper()]
+        return [dict(record, timestamp=self._format_timestamp(record['timestamp']))
+                for record in list(self._records) if RECORD_LEVELS[record['level']] >= min_level]
+
+    def to_json(self, min_level=logging.DEBUG):
+        return json.dumps(self.records(min_level), indent=2)
+
+    @property
+    def cache(self):
+        """ The cached tail as formatted lines; stack traces are split across lines """
+        lines = list()
+        for record in self.records():
+            if record['level'] == 'TRACEBACK':
+                lines.extend(record['message'].split('\n'))
+            else:
+                lines.append('{} - {} - {}'.format(record['timestamp'], record['level'], record['message']))
+        return lines
+
+    def _log(self, level, level_name, message, args, exc_info=False):
+        # Disabled levels return before any caller lookup or formatting
+        if not self._logger.isEnabledFor(level):
+            return
+
+        if args:
+            message = message.format(*args)
+
+        # Frame 0 is _log, 1 the public method, 2 its caller; a single frame hop instead of inspect.stack()
+        caller = sys._getframe(2).f_code.co_name
+
+        self._logger.log(level, message, exc_info=exc_info, extra={'caller': caller})
+        self._cache_record(level_name, caller, message)
+
+    def info(self, message, *args):
+        self._log(logging.INFO, 'INFO', message, args)
+
+    def debug(self, message, *args):
+        self._log(logging.DEBUG, 'DEBUG', message, args)
+
+    def warning(self, message, *args):
+        self._log(logging.WARNING, 'WARNING', message, args)
+
+    def error(self, message, *args):
+        self._log(logging.ERROR, 'ERROR', message, args)
+
+    def exception(self, message, *args):
+        self._log(logging.ERROR, 'EXCEPTION', message, args, exc_info=True)
 
     def append_stack_trace(self, stack_trace_string):
-        stack_trace_string = stack_trace_string.split('\n')
-        self.cache.extend(stack_trace_string)
+        # One record however long the trace is, so it can't push the cache past cache_limit
+        self._cache_record('TRACEBACK', sys._getframe(1).f_code.co_name, stack_trace_string.rstrip('\n'))
@@ -0,0 +1,59 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class PhaseTimer(object):
+
+    """
+    Records how long each named phase of a run takes, and summarizes them as histograms (count, p50, p95, max).
+    Phases may nest (e.g. 'find' includes its 'load_page'), so totals are per phase, not additive.
+    One timer per thread; use merge() to combine them at the end of a run.
+    """
+
+    def __init__(self):
+        self._durations = defaultdict(list)
+
+    @contextmanager
+    def time(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._durations[phase].append(time.perf_counter() - start)
+
+    def record(self, phase, seconds):
+        self._durations[phase].append(seconds)
+
+    def merge(self, other):
+        for phase, durations in other._durations.items():
+            self._durations[phase].extend(durations)
+
+    @staticmethod
+    def _percentile(sorted_durations, percent):
+        """ Nearest-rank percentile of an already sorted list """
+        index = max(0, int(round(percent / 100 * len(sorted_durations))) - 1)
+        return sorted_durations[index]
+
+    def summary(self):
+        """
+        :return: dict of phase -> {'count', 'total', 'p50', 'p95', 'max'}, in seconds
+        """
+        phases = dict()
+        for phase, durations in sorted(self._durations.items()):
+            ordered = sorted(durations)
+            phases[phase] = {'count': len(ordered),
+                             'total': round(sum(ordered), 3),
+                             'p50': round(self._percentile(ordered, 50), 3),
+                             'p95': round(self._percentile(ordered, 95), 3),
+                             'max': round(ordered[-1], 3)}
+        return phases
+
+    def write_json(self, file_path, metrics_dict=None):
+        """ Write the phase summary, plus any run metrics, as a JSON file """
+        report = {'metrics': metrics_dict or dict(), 'phases': self.summary()}
+        with open(file_path, 'w') as f:
+            # Run metrics include datetimes and timedeltas
+            json.dump(report, f, indent=2, default=str)
+        return file_path
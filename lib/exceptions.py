@@ -14,3 +14,9 @@ class TorProxyException(BaseException):
     pass
 
 
+class RowJournalException(BaseException):
+    pass
+
+
+class ResultGathererException(BaseException):
+    pass
@@ -1,6 +1,8 @@
 import boto3
+import csv
 import logging
 import requests
+import sys
 from botocore.exceptions import ClientError
 from datetime import datetime
 from os import path
@@ -27,6 +29,11 @@ def create_new_filename(in_path, overwrite_existing=False):
     return out_path
 
 
+def allow_large_csv_fields():
+    """ Sheet cells can be far larger than the csv module's default field limit; lift it for every reader """
+    csv.field_size_limit(sys.maxsize)
+
+
 def create_logger(caller, debug=False):
     """ General purpose logger with simple configuration """
     if debug:
@@ -45,13 +52,27 @@ def create_logger(caller, debug=False):
     return new_logger
 
 
-def upload_file(file_name, bucket, object_name=None):
+# One S3 client per endpoint for the whole process; clients are thread-safe and slow to build
+_s3_clients = dict()
+
+
+def get_s3_client(endpoint_url=None):
+    """
+    :param endpoint_url: S3-compatible endpoint (e.g. a local MinIO or moto server); None for AWS
+    """
+    if endpoint_url not in _s3_clients:
+        _s3_clients[endpoint_url] = boto3.client('s3', endpoint_url=endpoint_url)
+    return _s3_clients[endpoint_url]
+
+
+def upload_file(file_name, bucket, object_name=None, endpoint_url=None):
     """
     Upload a file to an S3 bucket
 
     :param file_name: File to upload
     :param bucket: Bucket to upload to
     :param object_name: S3 object name. If not specified then file_name is used
+    :param endpoint_url: S3-compatible endpoint; None for AWS
     """
 
     # If S3 object_name was not specified, use file_name
@@ -59,20 +80,26 @@ def upload_file(file_name, bucket, object_name=None):
         object_name = file_name
 
     # Upload the file
-    s3_client = boto3.client('s3')
+    s3_client = get_s3_client(endpoint_url)
     try:
         response = s3_client.upload_file(file_name, bucket, object_name)
     except ClientError as e:
         raise e
 
 
-def create_s3_object_key(local_file_path, hostname):
+def create_s3_object_key(local_file_path, hostname, segment=None):
+    """
+    :param segment: optional segment name, e.g. 'rows000001-000250', for a piece of the file uploaded mid-run
+    """
     # Remove any file extension from the path
     full_path, extension = path.splitext(local_file_path)
     # Remove preceding path elements
     file_name = path.basename(full_path)
     # Assemble!
-    object_name = '{}.{}{}'.format(file_name, hostname, extension)
+    if segment is None:
+        object_name = '{}.{}{}'.format(file_name, hostname, extension)
+    else:
+        object_name = '{}.{}.{}{}'.format(file_name, hostname, segment, extension)
     return object_name
 
 
@@ -0,0 +1,74 @@
+import csv
+import heapq
+import os
+import shutil
+import tempfile
+
+from lib.util import allow_large_csv_fields
+
+# Rows held in memory before a sorted chunk is spilled to disk
+DEFAULT_CHUNK_SIZE = 100000
+
+
+class ExternalSorter(object):
+
+    """
+    Sorts more records than fit in memory.
+    Records (lists of strings) are sorted in fixed-size chunks, each chunk is spilled to a temporary CSV file,
+    and iteration lazily k-way merges the chunk files. Memory use is bounded by chunk_size, not the input size.
+    Equal keys keep the order they were added in.
+    """
+
+    def __init__(self, key, chunk_size=DEFAULT_CHUNK_SIZE, temp_dir=None):
+        self._key = key
+        self._chunk_size = chunk_size
+        self._temp_dir = tempfile.mkdtemp(prefix='.sort_', dir=temp_dir)
+        self._buffer = list()
+        self._chunk_files = list()
+        self.count = 0
+
+        allow_large_csv_fields()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, record):
+        self._buffer.append(record)
+        self.count += 1
+        if len(self._buffer) >= self._chunk_size:
+            self._spill()
+
+    def _spill(self):
+        """ Sort the in-memory buffer and write it out as the next chunk file """
+        self._buffer.sort(key=self._key)
+        chunk_path = os.path.join(self._temp_dir, 'chunk_{}.csv'.format(len(self._chunk_files)))
+        with open(chunk_path, 'w', newline='') as f:
+            csv.writer(f).writerows(self._buffer)
+        self._chunk_files.append(chunk_path)
+        self._buffer = list()
+
+    @staticmethod
+    def _read_chunk(chunk_path):
+        with open(chunk_path, 'r', newline='') as f:
+            for record in csv.reader(f):
+                yield record
+
+    def __iter__(self):
+        """ Yield every record added so far, in sorted order """
+        # Everything fit in one chunk; skip the disk entirely
+        if len(self._chunk_files) == 0:
+            self._buffer.sort(key=self._key)
+            return iter(self._buffer)
+
+        if len(self._buffer) > 0:
+            self._spill()
+        return heapq.merge(*[self._read_chunk(chunk_path) for chunk_path in self._chunk_files], key=self._key)
+
+    def close(self):
+        """ Delete all chunk files """
+        self._buffer = list()
+        self._chunk_files = list()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
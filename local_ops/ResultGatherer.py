@@ -0,0 +1,217 @@
+import csv
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+
+from lib.AtomicCsvWriter import AtomicCsvWriter
+from lib.exceptions import ResultGathererException
+from lib.util import allow_large_csv_fields, get_s3_client
+
+# Parallel S3 downloads
+DEFAULT_WORKERS = 16
+
+# How complete a row's 'scraped' value says it is; the most complete version of each row wins
+UNSCRAPED = 0
+ATTEMPTED = 1
+SCRAPED = 2
+
+
+class ResultGatherer(object):
+
+    """
+    Pulls every host's copy of one scrape output from S3 and reconciles them into a single sheet.
+
+    Each host uploads a full copy of the input sheet ('<input>_<date>.<hostname>.csv'), in input order, with only its
+    own rows scraped. A host that died mid-run may only have the segments it uploaded while running
+    ('<input>_<date>.<hostname>.rows000001-000250.csv'); those are stitched back together in row order instead.
+    Hosts that started (or were resumed) on different days upload under different dates, so every date is gathered
+    unless dates are given, and each host's copy from each date is reconciled like any other host's.
+
+    All host copies are then streamed side by side, one row at a time, so memory use does not grow with the sheet
+    size or host count. For each row, the version whose 'scraped' value is the most complete wins (scraped by a site,
+    then failed or skipped, then not scraped at all); ties go to the first host by name. Rows are matched up by
+    position and checked against the ID column, so copies that don't line up are refused rather than mixed.
+    """
+
+    def __init__(self, bucket, input_stem, id_column, download_dir, dates=None, expected_hosts=None, endpoint_url=None,
+                 workers=DEFAULT_WORKERS):
+        """
+        :param input_stem: input sheet file name without its extension
+        :param dates: YYYYMMDD output dates to gather; None gathers every date
+        :param expected_hosts: hostnames that must each have an output; None accepts whichever hosts uploaded
+        """
+        self._bucket = bucket
+        self._input_stem = input_stem
+        self._id_column = id_column
+        self._download_dir = download_dir
+        self._dates = set(dates) if dates is not None else None
+        self._expected_hosts = set(expected_hosts) if expected_hosts is not None else None
+        self._workers = workers
+        self._client = get_s3_client(endpoint_url)
+
+        self._key_pattern = re.compile(r'^{}_(?P<date>\d{{8}})\.(?P<host>.+?)(?:\.rows(?P<first>\d+)-(?P<last>\d+))?'
+                                       r'\.csv$'.format(re.escape(input_stem)))
+
+        # '<hostname> (<date>)' -> local path of that copy's full output, or list of (first row, last row, local path)
+        # segments
+        self.outputs = dict()
+        self.segments = dict()
+
+        allow_large_csv_fields()
+
+    def list_objects(self):
+        """
+        :return: list of (object key, hostname, copy name, first row, last row); rows are None for full outputs.
+                 The copy name, '<hostname> (<date>)', tells apart a host's outputs from different days.
+        """
+        objects = list()
+        paginator = self._client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self._bucket, Prefix='{}_'.format(self._input_stem)):
+            for entry in page.get('Contents', list()):
+                match = self._key_pattern.match(entry['Key'])
+                if match is None:
+                    continue
+                if self._dates is not None and match.group('date') not in self._dates:
+                    continue
+                first_row = int(match.group('first')) if match.group('first') is not None else None
+                last_row = int(match.group('last')) if match.group('last') is not None else None
+                copy = '{} ({})'.format(match.group('host'), match.group('date'))
+                objects.append((entry['Key'], match.group('host'), copy, first_row, last_row))
+        return objects
+
+    def download(self):
+        """ Download every host copy's full output, or its segments when it has no full output, in parallel """
+        objects = self.list_objects()
+        if len(objects) == 0:
+            raise ResultGathererException('No outputs for \'{}\' found in bucket {}.'.format(self._input_stem,
+                                                                                           self._bucket))
+
+        if self._expected_hosts is not None:
+            missing_hosts = self._expected_hosts - {host for key, host, copy, first_row, last_row in objects}
+            if len(missing_hosts) > 0:
+                raise ResultGathererException('No output for \'{}\' found from host(s): {}.'.format(
+                    self._input_stem, ', '.join(sorted(missing_hosts))))
+
+        finished_copies = {copy for key, host, copy, first_row, last_row in objects if first_row is None}
+        wanted = [(key, copy, first_row, last_row) for key, host, copy, first_row, last_row in objects
+                  if first_row is None or copy not in finished_copies]
+
+        os.makedirs(self._download_dir, exist_ok=True)
+
+        def fetch(key):
+            local_path = os.path.join(self._download_dir, key)
+            self._client.download_file(self._bucket, key, local_path)
+            return local_path
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            local_paths = list(executor.map(fetch, [key for key, copy, first_row, last_row in wanted]))
+
+        for (key, copy, first_row, last_row), local_path in zip(wanted, local_paths):
+            if first_row is None:
+                self.outputs[copy] = local_path
+            else:
+                self.segments.setdefault(copy, list()).append((first_row, last_row, local_path))
+
+        print('Host copies with a full output: {} ({})'.format(len(self.outputs), ', '.join(sorted(self.outputs))))
+        if len(self.segments) > 0:
+            print('Host copies with only mid-run segments: {} ({})'.format(len(self.segments),
+                                                                          ', '.join(sorted(self.segments))))
+
+    @staticmethod
+    def _read_rows(file_path):
+        with open(file_path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                yield row
+
+    @staticmethod
+    def _read_segment_rows(segments):
+        """ Rows of a host's segments in row order; overlapping segments (from a resumed run) hold the same rows """
+        rows_read = 0
+        for first_row, last_row, file_path in sorted(segments):
+            if first_row > rows_read + 1:
+                print('    Rows {}-{} were never uploaded; stopping there.'.format(rows_read + 1, first_row - 1))
+                return
+            for row_number, row in enumerate(ResultGatherer._read_rows(file_path), start=first_row):
+                if row_number > rows_read:
+                    rows_read = row_number
+                    yield row
+
+    @staticmethod
+    def _fieldnames(file_path):
+        with open(file_path, 'r', newline='') as f:
+            return next(csv.reader(f), list())
+
+    @staticmethod
+    def completeness(row):
+        scraped = (row.get('scraped') or '').strip().lower()
+        if scraped == '':
+            return UNSCRAPED
+        elif scraped in ('failed', 'skip'):
+            return ATTEMPTED
+        return SCRAPED
+
+    def reconcile(self, out_file):
+        """
+        Stream the downloaded host copies into one sheet
+        :return: dict of counts
+        """
+        hosts = sorted(set(self.outputs) | set(self.segments))
+        streams = list()
+        fieldnames = list()
+        for host in hosts:
+            if host in self.outputs:
+                streams.append(self._read_rows(self.outputs[host]))
+                host_fieldnames = self._fieldnames(self.outputs[host])
+            else:
+                streams.append(self._read_segment_rows(self.segments[host]))
+                host_fieldnames = self._fieldnames(sorted(self.segments[host])[0][2])
+            fieldnames.extend(name for name in host_fieldnames if name not in fieldnames)
+
+        if self._id_column not in fieldnames:
+            raise ResultGathererException('ID column \'{}\' is not in the host outputs.'.format(self._id_column))
+
+        counts = {'rows': 0, 'scraped': 0, 'attempted': 0, 'unscraped': 0}
+        rows_from_host = dict.fromkeys(hosts, 0)
+
+        with AtomicCsvWriter(out_file, fieldnames) as writer:
+            print('Writing out to: {}'.format(out_file))
+
+            for versions in zip_longest(*streams):
+                counts['rows'] += 1
+
+                best_index = None
+                best_rank = -1
+                row_id = None
+                id_host = None
+                for index, row in enumerate(versions):
+                    if row is None:
+                        continue
+                    if id_host is None:
+                        row_id = row.get(self._id_column)
+                        id_host = hosts[index]
+                    elif row.get(self._id_column) != row_id:
+                        raise ResultGathererException('Host outputs disagree at row {}: {} has {} \'{}\' where {} has '
+                                                      '\'{}\'.'.format(counts['rows'], hosts[index], self._id_column,
+                                                                       row.get(self._id_column),
+                                                                       id_host, row_id))
+                    rank = self.completeness(row)
+                    if rank > best_rank:
+                        best_index = index
+                        best_rank = rank
+
+                writer.writerow(versions[best_index])
+                rows_from_host[hosts[best_index]] += 1
+                if best_rank == SCRAPED:
+                    counts['scraped'] += 1
+                elif best_rank == ATTEMPTED:
+                    counts['attempted'] += 1
+                else:
+                    counts['unscraped'] += 1
+
+        counts['rows_from_host'] = rows_from_host
+        return counts
+
+    def clean_up(self):
+        shutil.rmtree(self._download_dir, ignore_errors=True)
@@ -1,20 +1,39 @@
 import csv
 
 from copy import deepcopy
+from itertools import groupby
+from operator import itemgetter
 from os import path
 
+from lib.AtomicCsvWriter import AtomicCsvWriter
 from lib.exceptions import SheetManagerException
 from lib.util import create_new_filename
+from local_ops.ExternalSorter import ExternalSorter, DEFAULT_CHUNK_SIZE
 
 SEP = '-' * 70
 
+# 'hash' indexes the child sheet by normalized ID; 'sort' is an on-disk sort-merge join for sheets larger than RAM;
+#   'nested' is the original row-by-row comparison. When several children share an ID, nested skips every child right
+#   after a matched one (it removes from the list it is iterating), so those land in the orphan tail or on a later
+#   master row instead; hash and sort give every child to the first master row with its ID.
+JOIN_METHODS = ('hash', 'sort', 'nested')
+
 
 class SheetManager(object):
 
-    def __init__(self, master_config, child_config, overwrite=False, verbose=False):
+    def __init__(self, master_config, child_config, overwrite=False, verbose=False, join_method='hash',
+                 sort_chunk_size=DEFAULT_CHUNK_SIZE):
 
         self.verbose = verbose
 
+        if join_method not in JOIN_METHODS:
+            raise SheetManagerException('Unsupported join method \'{}\'. '
+                                        'Choose from: {}'.format(join_method, ', '.join(JOIN_METHODS)))
+        self.join_method = join_method
+
+        # Rows per on-disk chunk for the 'sort' join
+        self._sort_chunk_size = sort_chunk_size
+
         # These are SheetConfig objects
         self._master_config = master_config
         self._child_config = child_config
@@ -38,6 +57,9 @@ class SheetManager(object):
         self.child_reader = self._initialize_csv_reader(self._child_csv_path)
         self.child_reader.fieldnames = self._make_child_fieldnames_unique()
 
+        # Child values never go into the master's own columns, even empty ones
+        self._master_fieldnames = set(self.master_reader.fieldnames)
+
     @staticmethod
     def _initialize_csv_reader(file_path):
         return csv.DictReader(open(file_path))
@@ -52,6 +74,15 @@ class SheetManager(object):
         return unique_fieldnames
 
     def merge(self):
+        """ Merge child into master using match_column, via the configured join method """
+        if self.join_method == 'nested':
+            self._nested_merge()
+        elif self.join_method == 'sort':
+            self._sort_merge()
+        else:
+            self._hash_merge()
+
+    def _nested_merge(self):
         """
         Merge child into master using match_column
 
@@ -93,12 +124,8 @@ class SheetManager(object):
                 print('    Child rows with incorrect ID lengths: {}'.format(len(unwanted_child_ids)))
             print(SEP)
 
-            with open(self.out_file, 'w') as out:
+            with AtomicCsvWriter(self.out_file, output_fieldnames) as output_writer:
                 print('Writing out to: {}'.format(self.out_file))
-                output_writer = csv.DictWriter(out, output_fieldnames)
-
-                # Initialize output CSV
-                output_writer.writeheader()
 
                 # Iterate through master rows
                 for m_row in self.master_reader:
@@ -192,6 +219,7 @@ class SheetManager(object):
                 if start_over:
                     if self.verbose:
                         print('Re-initializing readers...')
+                    output_writer.discard()
                     self.master_reader = self._initialize_csv_reader(self._master_csv_path)
                     self.child_reader = self._initialize_csv_reader(self._child_csv_path)
                     continue
@@ -212,6 +240,283 @@ class SheetManager(object):
             for c_id in unwanted_child_ids:
                 print('    {}'.format(c_id))
 
+    def _hash_merge(self):
+        """
+        Merge child into master using a dict index of normalized child IDs
+
+        Every child row is read and normalized exactly once, then master rows are streamed through the index,
+        so the cost grows linearly with the size of both sheets instead of their product.
+        The full output header is planned up front, so the output is written in a single pass.
+        Every child goes to the first master row with its ID; see JOIN_METHODS for where this differs from nested.
+        """
+
+        child_rows, child_index, unwanted_child_ids = self._index_child_rows()
+
+        output_fieldnames = self._plan_output_fieldnames(child_index)
+
+        claimed_ids = set()
+        aligned_count = 0
+
+        with AtomicCsvWriter(self.out_file, output_fieldnames) as output_writer:
+            print('Writing out to: {}'.format(self.out_file))
+
+            for m_row in self.master_reader:
+                out_dict = dict.fromkeys(output_fieldnames, '')
+                out_dict.update(m_row)
+
+                master_id = m_row[self._master_config.id_column]
+                n_master_id = self._normalize_uid(uid=master_id, actual_id_len=self._master_config.id_char_count)
+
+                # Only the first master row with a given ID receives its children
+                if n_master_id in child_index and n_master_id not in claimed_ids:
+                    claimed_ids.add(n_master_id)
+                    for c_row in child_index[n_master_id]:
+                        aligned_count += 1
+                        if self.verbose:
+                            print('    ID match: {}'.format(master_id))
+                        self._merge_child_row(out_dict, c_row)
+
+                output_writer.writerow(out_dict)
+
+            print('Rows aligned by {}: {}'.format(self._master_config.id_column, aligned_count))
+
+            # Don't forget the orphan children! They keep their original order.
+            orphan_rows = [c_row for n_child_id, c_row in child_rows if n_child_id not in claimed_ids]
+            print('Unmatched child rows appended to the end of the file: {}'.format(len(orphan_rows)))
+            for o_row in orphan_rows:
+                output_writer.writerow(o_row)
+
+        # Display unmatched child IDs for verification
+        if self.verbose:
+            print(SEP)
+            print('Child rows skipped due to ID length mismatch:')
+            for c_id in unwanted_child_ids:
+                print('    {}'.format(c_id))
+
+    def _plan_output_fieldnames(self, child_index):
+        """
+        Dry-run the merge over the master sheet to find every __N column that multi-child rows will need.
+        New columns are ordered by where they are first needed, matching the order the nested join discovers them.
+        Rewinds the master reader afterwards.
+        :param child_index: dict of normalized ID to child rows, as built by _index_child_rows
+        :return: list of output fieldnames
+        """
+        output_fieldnames = self.master_reader.fieldnames + self.child_reader.fieldnames
+        known_fieldnames = set(output_fieldnames)
+        claimed_ids = set()
+        max_children = 0
+
+        for m_row in self.master_reader:
+            master_id = m_row[self._master_config.id_column]
+            n_master_id = self._normalize_uid(uid=master_id, actual_id_len=self._master_config.id_char_count)
+
+            if n_master_id not in child_index or n_master_id in claimed_ids:
+                continue
+            claimed_ids.add(n_master_id)
+            max_children = max(max_children, len(child_index[n_master_id]))
+
+            out_dict = dict(m_row)
+            for c_row in child_index[n_master_id]:
+                for c_key in self._merge_child_row(out_dict, c_row):
+                    if c_key not in known_fieldnames:
+                        known_fieldnames.add(c_key)
+                        output_fieldnames.append(c_key)
+
+        print('Most children matched to a single master row: {}'.format(max_children))
+        print('Output columns: {}'.format(len(output_fieldnames)))
+        if self.verbose:
+            print('    Added columns: {}'.format(output_fieldnames[len(self.master_reader.fieldnames) +
+                                                                len(self.child_reader.fieldnames):]))
+        print(SEP)
+
+        self.master_reader = self._initialize_csv_reader(self._master_csv_path)
+        return output_fieldnames
+
+    def _sort_merge(self):
+        """
+        Merge child into master with an external sort-merge join
+
+        Both sheets are sorted by normalized ID in on-disk chunks and then walked side by side one ID at a time,
+        so memory stays flat no matter how large the sheets are. The joined rows are sorted back into master order
+        on disk before writing, so the output matches the hash join.
+        Chunk files are written alongside the output file, which is usually a roomier disk than /tmp.
+        """
+
+        master_fieldnames = self.master_reader.fieldnames
+        child_fieldnames = self.child_reader.fieldnames
+        temp_dir = path.dirname(self.out_file)
+
+        # Records are [normalized ID, row number, *values]; the row number keeps equal IDs in file order
+        by_id = lambda record: (record[0], int(record[1]))
+        by_row_number = lambda record: int(record[0])
+
+        with ExternalSorter(key=by_id, chunk_size=self._sort_chunk_size, temp_dir=temp_dir) as sorted_masters, \
+                ExternalSorter(key=by_id, chunk_size=self._sort_chunk_size, temp_dir=temp_dir) as sorted_children, \
+                ExternalSorter(key=by_row_number, chunk_size=self._sort_chunk_size, temp_dir=temp_dir) as joined, \
+                ExternalSorter(key=by_row_number, chunk_size=self._sort_chunk_size, temp_dir=temp_dir) as orphans:
+
+            for row_number, m_row in enumerate(self.master_reader):
+                master_id = m_row[self._master_config.id_column]
+                n_master_id = self._normalize_uid(uid=master_id, actual_id_len=self._master_config.id_char_count)
+                sorted_masters.add([n_master_id, row_number] + [m_row[name] for name in master_fieldnames])
+
+            unwanted_child_count = 0
+            unwanted_child_ids = list()
+            for row_number, c_row in enumerate(self.child_reader):
+
+                # Only add child if its ID len matches the master config length!
+                child_id = c_row[self._child_config.id_column]
+                n_child_id = self._normalize_uid(uid=child_id)
+                if self._master_config.id_char_count == 'mixed' or \
+                        len(n_child_id) == self._master_config.id_char_count:
+                    sorted_children.add([n_child_id, row_number] + [c_row[name] for name in child_fieldnames])
+                else:
+                    unwanted_child_count += 1
+                    # Only kept around for display
+                    if self.verbose:
+                        unwanted_child_ids.append(child_id)
+
+            print(SEP)
+            print('Total master rows sorted: {}'.format(sorted_masters.count))
+            print('Total child rows processed: {}'.format(sorted_children.count + unwanted_child_count))
+            if self._master_config.id_char_count != 'mixed':
+                print('    Child rows with proper ID lengths: {}'.format(sorted_children.count))
+                print('    Child rows with incorrect ID lengths: {}'.format(unwanted_child_count))
+            print(SEP)
+
+            # Join one ID at a time. New __N columns are recorded with where they were first needed in master order.
+            output_fieldnames = master_fieldnames + child_fieldnames
+            base_fieldnames = set(output_fieldnames)
+            known_fieldnames = set(output_fieldnames)
+            first_needed = dict()
+            aligned_count = 0
+
+            master_groups = groupby(sorted_masters, key=itemgetter(0))
+            child_groups = groupby(sorted_children, key=itemgetter(0))
+            n_master_id, master_group = next(master_groups, (None, None))
+            n_child_id, child_group = next(child_groups, (None, None))
+
+            while master_group is not None or child_group is not None:
+
+                # Children with no master row become orphans
+                if master_group is None or (child_group is not None and n_child_id < n_master_id):
+                    for record in child_group:
+                        orphans.add(record[1:])
+                    n_child_id, child_group = next(child_groups, (None, None))
+                    continue
+
+                c_rows = list()
+                if child_group is not None and n_child_id == n_master_id:
+                    c_rows = [dict(zip(child_fieldnames, record[2:])) for record in child_group]
+                    n_child_id, child_group = next(child_groups, (None, None))
+
+                # Only the first master row with a given ID receives its children
+                for record in master_group:
+                    row_number = int(record[1])
+                    out_dict = dict(zip(master_fieldnames, record[2:]))
+
+                    written_keys = list()
+                    for c_row in c_rows:
+                        aligned_count += 1
+                        if self.verbose:
+                            print('    ID match: {}'.format(out_dict[self._master_config.id_column]))
+                        written_keys.extend(self._merge_child_row(out_dict, c_row))
+                    c_rows = list()
+
+                    for position, c_key in enumerate(written_keys):
+                        if c_key in base_fieldnames:
+                            continue
+                        if c_key not in known_fieldnames:
+                            known_fieldnames.add(c_key)
+                            output_fieldnames.append(c_key)
+                        first_needed[c_key] = min(first_needed.get(c_key, (row_number, position)),
+                                                  (row_number, position))
+
+                    joined.add([row_number] + [out_dict.get(name, '') for name in output_fieldnames])
+
+                n_master_id, master_group = next(master_groups, (None, None))
+
+            # Joined records are padded out to the full header, then reordered to master-order discovery
+            base_count = len(master_fieldnames) + len(child_fieldnames)
+            added_fieldnames = sorted(output_fieldnames[base_count:], key=lambda name: first_needed[name])
+            final_fieldnames = output_fieldnames[:base_count] + added_fieldnames
+            if self.verbose:
+                print('    Added columns: {}'.format(added_fieldnames))
+            print('Output columns: {}'.format(len(final_fieldnames)))
+
+            with AtomicCsvWriter(self.out_file, final_fieldnames) as output_writer:
+                print('Writing out to: {}'.format(self.out_file))
+
+                for record in joined:
+                    values = record[1:]
+                    values += [''] * (len(output_fieldnames) - len(values))
+                    output_writer.writerow(dict(zip(output_fieldnames, values)))
+
+                print('Rows aligned by {}: {}'.format(self._master_config.id_column, aligned_count))
+
+                # Don't forget the orphan children! They keep their original order.
+                print('Unmatched child rows appended to the end of the file: {}'.format(orphans.count))
+                for record in orphans:
+                    output_writer.writerow(dict(zip(child_fieldnames, record[1:])))
+
+        # Display unmatched child IDs for verification
+        if self.verbose:
+            print(SEP)
+            print('Child rows skipped due to ID length mismatch:')
+            for c_id in unwanted_child_ids:
+                print('    {}'.format(c_id))
+
+    def _index_child_rows(self):
+        """
+        Read every child row once and index it by normalized ID
+        :return: tuple of ([(normalized ID, row), ...] in file order, {normalized ID: [row, ...]}, [skipped IDs])
+        """
+        child_rows = list()
+        child_index = dict()
+        unwanted_child_ids = list()
+
+        total_children = 0
+        for row in self.child_reader:
+            total_children += 1
+
+            # Only add child if its ID len matches the master config length!
+            child_id = row[self._child_config.id_column]
+            n_child_id = self._normalize_uid(uid=child_id)
+            if self._master_config.id_char_count == 'mixed' or len(n_child_id) == self._master_config.id_char_count:
+                child_rows.append((n_child_id, row))
+                child_index.setdefault(n_child_id, list()).append(row)
+            else:
+                unwanted_child_ids.append(child_id)
+
+        print(SEP)
+        print('Total child rows processed: {}'.format(total_children))
+        if self._master_config.id_char_count != 'mixed':
+            print('    Child rows with proper ID lengths: {}'.format(len(child_rows)))
+            print('    Child rows with incorrect ID lengths: {}'.format(len(unwanted_child_ids)))
+        print(SEP)
+
+        return child_rows, child_index, unwanted_child_ids
+
+    def _merge_child_row(self, out_dict, c_row):
+        """
+        Copy a child row's values into out_dict without overwriting anything already there.
+        A value that collides with a master column or a populated cell goes to the first empty or new __N incremented
+        column instead.
+        :return: list of the keys written, in order
+        """
+        written_keys = list()
+        for c_key, c_value in c_row.items():
+
+            # A master column, or more than one child found for master row? Increment until a free column turns up.
+            if c_key != self._child_config.id_column:
+                while c_key in self._master_fieldnames or out_dict.get(c_key):
+                    c_key = self.__increment_key(c_key)
+
+            out_dict[c_key] = c_value
+            written_keys.append(c_key)
+
+        return written_keys
+
     def prune(self):
         raise SheetManagerException('prune method not yet implemented')
 
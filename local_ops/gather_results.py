@@ -0,0 +1,92 @@
+import sys
+import traceback
+from argparse import ArgumentParser
+from csv import DictReader
+from os import path
+import time
+
+from SheetConfig import SheetConfig
+from lib.exceptions import ResultGathererException, SheetConfigException
+from local_ops.ResultGatherer import ResultGatherer, DEFAULT_WORKERS
+
+SEP = '-' * 70
+
+
+def sheet_hostnames(sheet_path):
+    """ :return: set of hosts the sheet's 'hostname' column assigns rows to, or None if it has no such column """
+    if not path.isfile(sheet_path):
+        return None
+    with open(sheet_path, 'r', newline='') as f:
+        reader = DictReader(f)
+        if 'hostname' not in (reader.fieldnames or list()):
+            return None
+        return {row['hostname'] for row in reader if row['hostname']}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--config',       required=True, help='Scrape config name the hosts ran')
+    parser.add_argument('--bucket',       required=True, help='S3 bucket the hosts uploaded to')
+    parser.add_argument('--date',         action='append', dest='dates', metavar='YYYYMMDD',
+                        help='Output date to gather; repeat for several (default: every date)')
+    parser.add_argument('--hosts',        nargs='+', metavar='HOSTNAME',
+                        help='Hosts that must each have an output (default: those in the sheet\'s hostname column, '
+                             'if it has one)')
+    parser.add_argument('--endpoint-url', required=False, help='S3-compatible endpoint, instead of AWS')
+    parser.add_argument('--workers',      default=DEFAULT_WORKERS, type=int, help='Parallel downloads')
+    parser.add_argument('--keep-downloads', default=False, action='store_true',
+                        help='Keep the downloaded host outputs after reconciling')
+    args = parser.parse_args()
+
+    start = time.time()
+
+    try:
+        sheet_config = SheetConfig(args.config)
+    except SheetConfigException as e:
+        print('Failed to load configuration. Error: {}'.format(e))
+        traceback.print_exc()
+        sys.exit(1)
+
+    # Hosts upload '<input>_<date>.<hostname>.csv'; the gathered sheet is written next to the input
+    in_file = path.expanduser(sheet_config.location)
+    stem = path.splitext(path.basename(in_file))[0]
+    if args.dates is not None and len(args.dates) == 1:
+        out_file = path.join(path.dirname(in_file), '{}_{}_gathered.csv'.format(stem, args.dates[0]))
+    else:
+        out_file = path.join(path.dirname(in_file), '{}_gathered.csv'.format(stem))
+    download_dir = path.join(path.dirname(in_file), '.gather_{}'.format(stem))
+
+    expected_hosts = args.hosts if args.hosts is not None else sheet_hostnames(in_file)
+    if expected_hosts is not None:
+        print('Expecting outputs from: {}'.format(', '.join(sorted(expected_hosts))))
+
+    gatherer = ResultGatherer(bucket=args.bucket, input_stem=stem, id_column=sheet_config.id_column,
+                              download_dir=download_dir, dates=args.dates, expected_hosts=expected_hosts,
+                              endpoint_url=args.endpoint_url, workers=args.workers)
+    try:
+        print('Gathering {}_{}.<hostname>.csv from {}'.format(stem, '|'.join(args.dates or ['<date>']), args.bucket))
+        gatherer.download()
+        counts = gatherer.reconcile(out_file)
+
+    except ResultGathererException as error:
+        print('Gathering failed. Error: {}'.format(error))
+        traceback.print_exc()
+        sys.exit(1)
+
+    finally:
+        if not args.keep_downloads:
+            gatherer.clean_up()
+
+    print(SEP)
+    print('Total rows: {}'.format(counts['rows']))
+    print('    Scraped: {}'.format(counts['scraped']))
+    print('    Failed or skipped: {}'.format(counts['attempted']))
+    print('    Not scraped by any host: {}'.format(counts['unscraped']))
+    print('Rows taken from each host copy:')
+    for host, row_count in sorted(counts['rows_from_host'].items()):
+        print('    {}: {}'.format(host, row_count))
+
+    end = time.time()
+    elapsed = time.strftime('%H:%M:%S', time.gmtime(end - start))
+    print('=' * 70)
+    print('Total run time: {}'.format(elapsed))
@@ -5,7 +5,8 @@ import time
 
 from SheetConfig import SheetConfig
 from lib.exceptions import SheetConfigException, SheetManagerException
-from local_ops.SheetManager import SheetManager
+from local_ops.ExternalSorter import DEFAULT_CHUNK_SIZE
+from local_ops.SheetManager import SheetManager, JOIN_METHODS
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -13,12 +14,21 @@ if __name__ == '__main__':
     parser.add_argument('--child-config',  required=True, help='Child config name')
     parser.add_argument('--overwrite',     default=False, action='store_true', help='Overwrite the existing master file')
     parser.add_argument('--verbose', '-v', default=False, action='store_true', help='Display more detailed information')
+    parser.add_argument('--join-method',   default='hash', choices=JOIN_METHODS,
+                        help='hash: index child rows by ID (fast); sort: on-disk sort-merge join (low memory); '
+                             'nested: compare every row pair (legacy; when children share an ID, it skips the one '
+                             'after each match, leaving it for a later master row or the orphan rows)')
+    parser.add_argument('--external-sort', default=False, action='store_true',
+                        help='Shorthand for --join-method sort, for sheets too large to hold in memory')
+    parser.add_argument('--sort-chunk-rows', default=DEFAULT_CHUNK_SIZE, type=int,
+                        help='Rows held in memory per sorted chunk when using the sort join')
     args = parser.parse_args()
 
     master_config_name = args.master_config
     child_config_name = args.child_config
     overwrite = args.overwrite
     verbose = args.verbose
+    join_method = 'sort' if args.external_sort else args.join_method
 
     master_config = None
     child_config = None
@@ -37,7 +47,8 @@ if __name__ == '__main__':
 
     try:
         # Create sheet manager object
-        manager = SheetManager(master_config=master_config, child_config=child_config, verbose=verbose)
+        manager = SheetManager(master_config=master_config, child_config=child_config, verbose=verbose,
+                               join_method=join_method, sort_chunk_size=args.sort_chunk_rows)
         manager.merge()
 
     except SheetManagerException as error:
@@ -1,7 +1,11 @@
+import io
+import locale
 import os
 import re
 from argparse import ArgumentParser
-from csv import DictReader
+from csv import DictReader, reader
+from itertools import chain
+from multiprocessing import Pool
 
 
 # Broker Match Sheet to Master File mapping
@@ -11,6 +15,15 @@ mapping = {
     'Email': ['Owner1 Email', 'Owner2 Email']
 }
 
+# Phone-type tags such as ' (Cell)' that trail some numbers
+PHONE_TAG_PATTERN = re.compile(' *\\([A-Za-z]+\\)')
+
+# Target size of each master file chunk handed to a worker process
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# Read-only broker index, installed once per worker process by _initialize_worker
+_worker_broker_index = None
+
 
 def normalize_cell_text(cell_content):
     """
@@ -20,7 +33,7 @@ def normalize_cell_text(cell_content):
     """
     # Remove any phone-type tags
     try:
-        cell_content = ''.join(re.split(' *\\([A-Za-z]+\\)', cell_content))
+        cell_content = ''.join(PHONE_TAG_PATTERN.split(cell_content))
     except TypeError as e:
         raise TypeError('Failed to regex search on cell: {}. {}'.format(cell_content, e))
 
@@ -34,7 +47,106 @@ def normalize_cell_text(cell_content):
     return cell_content
 
 
-def match_rows(broker_file, master_file, output_file):
+def build_broker_index(broker_rows):
+    """
+    Normalize every broker contact value exactly once
+    :param broker_rows: Iterable of broker sheet row dicts
+    :return: dict of master column -> {normalized value: line number of the first broker row holding it}
+    """
+    broker_index = dict()
+
+    # Line 1 is the header
+    for line_number, broker_row in enumerate(broker_rows, start=2):
+        for broker_key, mapped_columns in mapping.items():
+            if broker_row[broker_key] == '':
+                continue
+            normalized_broker_value = normalize_cell_text(broker_row[broker_key])
+            if normalized_broker_value == '':
+                continue
+            for column in mapped_columns:
+                broker_index.setdefault(column, dict()).setdefault(normalized_broker_value, line_number)
+
+    return broker_index
+
+
+def match_master_row(master_row, broker_index):
+    """
+    Look up each of a master row's mapped contact values in the broker index
+    :param master_row: Master sheet row dict
+    :param broker_index: As built by build_broker_index
+    :return: (broker line number, matched value) for the earliest matching broker row, or None
+    """
+    match = None
+    for column, broker_values in broker_index.items():
+        if master_row.get(column) is None:
+            continue
+        for normalized_master_value in normalize_cell_text(master_row[column]).split(','):
+            line_number = broker_values.get(normalized_master_value)
+            if line_number is not None and (match is None or line_number < match[0]):
+                match = (line_number, normalized_master_value)
+    return match
+
+
+def split_byte_ranges(file_path, chunk_count):
+    """
+    Split a file's data lines (everything after the header) into roughly equal byte ranges on line boundaries.
+    Assumes no quoted cell spans multiple lines, which holds for the master TSV exports.
+    :return: list of (start, end) byte offsets, in file order
+    """
+    byte_ranges = list()
+    with open(file_path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        file_size = os.fstat(f.fileno()).st_size
+        chunk_size = max(1, (file_size - start) // chunk_count)
+
+        while start < file_size:
+            # Finish the line that straddles the target offset
+            f.seek(min(start + chunk_size, file_size) - 1)
+            f.readline()
+            end = f.tell()
+            byte_ranges.append((start, end))
+            start = end
+
+    return byte_ranges
+
+
+def _initialize_worker(broker_index):
+    global _worker_broker_index
+    _worker_broker_index = broker_index
+
+
+def _match_byte_range(task):
+    """ Worker process entry point: match every master row in one byte range """
+    master_path, fieldnames, start, end = task
+    with open(master_path, 'rb') as f:
+        f.seek(start)
+        chunk_text = f.read(end - start).decode(locale.getpreferredencoding(False))
+    master_rows = DictReader(io.StringIO(chunk_text, newline=''), fieldnames=fieldnames, delimiter='\t')
+    return [match_master_row(master_row, _worker_broker_index) for master_row in master_rows]
+
+
+def _generate_matches(master_path, broker_index):
+    with open(master_path, 'r') as m:
+        for master_row in DictReader(m, delimiter='\t'):
+            yield match_master_row(master_row, broker_index)
+
+
+def _generate_matches_in_parallel(master_path, broker_index, workers):
+    """ Match byte-range chunks of the master file in a process pool; results come back in file order """
+    with open(master_path, 'r') as m:
+        fieldnames = next(reader(m, delimiter='\t'))
+
+    chunk_count = max(workers * 4, os.path.getsize(master_path) // CHUNK_BYTES + 1)
+    tasks = [(master_path, fieldnames, start, end) for start, end in split_byte_ranges(master_path, chunk_count)]
+    print('Matching {} chunks across {} workers'.format(len(tasks), workers))
+
+    with Pool(processes=workers, initializer=_initialize_worker, initargs=(broker_index,)) as pool:
+        for match in chain.from_iterable(pool.imap(_match_byte_range, tasks)):
+            yield match
+
+
+def match_rows(broker_file, master_file, output_file, workers=1):
     total_master_rows = 0
     total_matched_rows = 0
 
@@ -42,43 +154,23 @@ def match_rows(broker_file, master_file, output_file):
     master_path = os.path.expanduser(master_file)
     out_path = os.path.expanduser(output_file)
 
-    # These are dangerous memory-wise
+    # Only the normalized broker values are held in memory; master rows are streamed
     with open(broker_path, 'r') as b:
-        broker_info = list(DictReader(b))
+        broker_index = build_broker_index(DictReader(b))
 
-    with open(master_path, 'r') as m:
-        master_info = list(DictReader(m, delimiter='\t'))
+    if workers > 1:
+        matches = _generate_matches_in_parallel(master_path, broker_index, workers)
+    else:
+        matches = _generate_matches(master_path, broker_index)
 
-    # I despise this amount of nesting
     with open(out_path, 'w') as f:
-        for master_row in master_info:
+        for match in matches:
             total_master_rows += 1
-            matched = False
-
-            for broker_row in broker_info:
-                if matched:
-                    break
-
-                for broker_key, mapped_columns in mapping.items():
-                    if matched:
-                        break
-                    if broker_row[broker_key] == '':
-                        continue
-                    for column in mapped_columns:
-                        if column not in master_row.keys():
-                            continue
-                        if master_row[column] is None:
-                            continue
-                        normalized_broker_value = normalize_cell_text(broker_row[broker_key])
-                        normalized_master_value = normalize_cell_text(master_row[column])
-                        if normalized_broker_value in normalized_master_value.split(','):
-                            matched = True
-                            print('Row {} Matched: {}'.format(total_master_rows + 1, broker_row[broker_key]))
-                            break
-
-            if matched:
+
+            if match is not None:
                 f.write('True\n')
                 total_matched_rows += 1
+                print('Row {} Matched broker row {}: {}'.format(total_master_rows + 1, *match))
             else:
                 f.write('False\n')
 
@@ -96,7 +188,10 @@ if __name__ == '__main__':
                             help='File containing rows to flag as matched or not')
     arg_parser.add_argument('--output', '-o', required=True,
                             help='File to write results to')
+    arg_parser.add_argument('--workers', '-w', type=int, default=1,
+                            help='Number of processes to match master rows with')
     args = arg_parser.parse_args()
     match_rows(broker_file=args.broker,
                master_file=args.master,
-               output_file=args.output)
+               output_file=args.output,
+               workers=args.workers)
@@ -0,0 +1,66 @@
+import json
+from os import path
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from selenium import webdriver
+
+from lib.exceptions import ScraperException
+
+
+class BrowserSessions(object):
+
+    """
+    Keeps Chrome browsers running between scrape runs, so the next run (of any config) attaches to an already warm,
+    logged-in browser instead of starting Chrome and logging in again.
+
+    Each session key (e.g. 'ic_0': site and browser index) gets a fixed DevTools port, recorded in a small JSON
+    registry. Chrome is launched detached with remote debugging on that port, so it outlives chromedriver and this
+    process; later runs find it listening there and attach. If it has died (reboot, crash), a fresh Chrome is launched
+    on the same port and Chrome profile, which still holds the session's cookies.
+
+    Only one run at a time should use a given session key.
+    """
+
+    BASE_PORT = 9300
+
+    def __init__(self, registry_file):
+        self._registry_file = registry_file
+        self._ports = dict()
+        if path.isfile(registry_file):
+            with open(registry_file, 'r') as f:
+                try:
+                    self._ports = json.load(f)
+                except ValueError as e:
+                    raise ScraperException('Unreadable browser session registry: {}. {}'.format(registry_file, e))
+
+    def port(self, key):
+        """ :return: the DevTools port of the session, assigning (and recording) a new one if needed """
+        if key not in self._ports:
+            self._ports[key] = max(list(self._ports.values()) + [BrowserSessions.BASE_PORT - 1]) + 1
+            with open(self._registry_file, 'w') as f:
+                json.dump(self._ports, f, indent=2, sort_keys=True)
+        return self._ports[key]
+
+    @staticmethod
+    def is_alive(port, host='127.0.0.1'):
+        """ :return: whether a Chrome is answering DevTools requests on the port """
+        try:
+            with urlopen('http://{}:{}/json/version'.format(host, port), timeout=1) as response:
+                return 'Browser' in json.loads(response.read().decode('utf-8'))
+        except (URLError, OSError, ValueError):
+            return False
+
+    @staticmethod
+    def attach_options(port, host='127.0.0.1'):
+        """ :return: ChromeOptions that attach chromedriver to the Chrome already running on the port """
+        options = webdriver.ChromeOptions()
+        options.add_experimental_option('debuggerAddress', '{}:{}'.format(host, port))
+        return options
+
+    @staticmethod
+    def keep_alive(options, port):
+        """ Have a newly launched Chrome listen on the port, and keep running after chromedriver exits """
+        options.add_argument('--remote-debugging-port={}'.format(port))
+        options.add_experimental_option('detach', True)
+        return options
@@ -0,0 +1,190 @@
+import json
+import sqlite3
+import threading
+import time
+from argparse import ArgumentParser
+from csv import DictReader
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import makedirs, path
+
+from SheetConfig import SheetConfig
+
+DEFAULT_PORT = 8642
+
+
+class Coordinator(object):
+
+    """
+    SQLite-backed work queue that leases batches of sheet rows to scrape workers.
+    Leases expire unless renewed, so a batch held by a dead worker can be leased again. Workers lease in row order as
+    they stream the sheet, so one that expires behind every worker's cursor is picked up by the first worker to finish
+    its pass over the sheet, which goes back for it (lease with min_row=1) until every batch is completed.
+    Row numbers are 1-based data rows (the header is not counted).
+    """
+
+    def __init__(self, db_path, total_rows, batch_size=25, lease_seconds=30 * 60):
+        self.db_path = path.expanduser(db_path)
+        makedirs(path.dirname(self.db_path), exist_ok=True)
+        self._lease_seconds = lease_seconds
+
+        # The HTTP server handles each request on its own thread
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS batches ('
+                                 'batch_id INTEGER PRIMARY KEY, '
+                                 'start_row INTEGER NOT NULL, '
+                                 'end_row INTEGER NOT NULL, '
+                                 'worker TEXT, '
+                                 'lease_expires REAL, '
+                                 'completed INTEGER NOT NULL DEFAULT 0)')
+
+        # An existing queue is picked back up as-is, so restarting the coordinator loses nothing
+        if self._connection.execute('SELECT COUNT(*) FROM batches').fetchone()[0] == 0:
+            self._connection.executemany('INSERT INTO batches (start_row, end_row) VALUES (?, ?)',
+                                         [(start, min(start + batch_size - 1, total_rows))
+                                          for start in range(1, total_rows + 1, batch_size)])
+        self._connection.commit()
+
+    def lease(self, worker, min_row=1):
+        """
+        Lease the earliest free (never leased or expired) batch starting at or after min_row; pass min_row=1 to reach
+        expired batches behind a worker's cursor.
+        A worker restarted mid-batch (e.g. with --resume) gets its own unfinished batch back first.
+        :return: dict with batch_id, start_row and end_row, or None if nothing is left
+        """
+        now = time.time()
+        with self._lock:
+            batch = self._connection.execute('SELECT batch_id, start_row, end_row, worker FROM batches '
+                                             'WHERE completed = 0 AND ('
+                                             '(worker = ? AND end_row >= ?) OR '
+                                             '((worker IS NULL OR lease_expires < ?) AND start_row >= ?)) '
+                                             'ORDER BY start_row LIMIT 1',
+                                             (worker, min_row, now, min_row)).fetchone()
+            if batch is None:
+                return None
+
+            batch_id, start_row, end_row, previous_worker = batch
+            self._connection.execute('UPDATE batches SET worker = ?, lease_expires = ? WHERE batch_id = ?',
+                                     (worker, now + self._lease_seconds, batch_id))
+            self._connection.commit()
+
+        if previous_worker is not None and previous_worker != worker:
+            print('Reclaimed batch {} (rows {}-{}) from {} for {}'.format(batch_id, start_row, end_row,
+                                                                          previous_worker, worker))
+        return {'batch_id': batch_id, 'start_row': start_row, 'end_row': end_row}
+
+    def renew(self, worker, batch_id):
+        """ :return: False if the lease was lost to another worker """
+        with self._lock:
+            cursor = self._connection.execute('UPDATE batches SET lease_expires = ? '
+                                              'WHERE batch_id = ? AND worker = ? AND completed = 0',
+                                              (time.time() + self._lease_seconds, batch_id, worker))
+            self._connection.commit()
+        return cursor.rowcount == 1
+
+    def complete(self, worker, batch_id):
+        with self._lock:
+            cursor = self._connection.execute('UPDATE batches SET completed = 1 WHERE batch_id = ? AND worker = ?',
+                                              (batch_id, worker))
+            self._connection.commit()
+        return cursor.rowcount == 1
+
+    def release(self, worker, batch_id):
+        """ Give an unfinished batch back immediately instead of waiting for the lease to expire """
+        with self._lock:
+            cursor = self._connection.execute('UPDATE batches SET worker = NULL, lease_expires = NULL '
+                                              'WHERE batch_id = ? AND worker = ? AND completed = 0',
+                                              (batch_id, worker))
+            self._connection.commit()
+        return cursor.rowcount == 1
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            total, completed, leased = self._connection.execute(
+                'SELECT COUNT(*), SUM(completed), SUM(completed = 0 AND worker IS NOT NULL AND lease_expires >= ?) '
+                'FROM batches', (now,)).fetchone()
+        return {'total_batches': total,
+                'completed_batches': completed or 0,
+                'leased_batches': leased or 0,
+                'available_batches': total - (completed or 0) - (leased or 0)}
+
+
+class _CoordinatorRequestHandler(BaseHTTPRequestHandler):
+
+    """ Thin JSON-over-HTTP wrapper around a Coordinator; see CoordinatorClient for the other side """
+
+    coordinator = None
+
+    def log_message(self, format, *args):
+        # Workers heartbeat after every row; per-request access logs would drown out reclaim messages
+        pass
+
+    def _send_json(self, status_code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.coordinator.status())
+        else:
+            self._send_json(404, {'error': 'Unknown path: {}'.format(self.path)})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            worker = request['worker']
+            if self.path == '/lease':
+                self._send_json(200, {'batch': self.coordinator.lease(worker, request.get('min_row', 1))})
+            elif self.path == '/renew':
+                self._send_json(200, {'ok': self.coordinator.renew(worker, request['batch_id'])})
+            elif self.path == '/complete':
+                self._send_json(200, {'ok': self.coordinator.complete(worker, request['batch_id'])})
+            elif self.path == '/release':
+                self._send_json(200, {'ok': self.coordinator.release(worker, request['batch_id'])})
+            else:
+                self._send_json(404, {'error': 'Unknown path: {}'.format(self.path)})
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {'error': 'Bad request: {}'.format(e)})
+
+
+def serve(coordinator, host='localhost', port=DEFAULT_PORT):
+    _CoordinatorRequestHandler.coordinator = coordinator
+    server = ThreadingHTTPServer((host, port), _CoordinatorRequestHandler)
+    print('Coordinator listening on http://{}:{}'.format(host, port))
+    print('Queue: {}'.format(coordinator.status()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Coordinator stopped.')
+    finally:
+        server.server_close()
+
+
+def count_sheet_rows(sheet_path):
+    with open(sheet_path, 'r') as f:
+        return sum(1 for _ in DictReader(f))
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(description='Lease batches of sheet rows to spreadsheet_scrape workers')
+    arg_parser.add_argument('--config', required=True, help='Sheet configuration name')
+    arg_parser.add_argument('--batch-size', type=int, default=25, help='Rows per leased batch')
+    arg_parser.add_argument('--lease-minutes', type=int, default=30,
+                            help='Minutes a lease lasts without a heartbeat before it can be reclaimed')
+    arg_parser.add_argument('--host', default='localhost', help='Interface to listen on; 0.0.0.0 for remote workers')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = arg_parser.parse_args()
+
+    sheet_config = SheetConfig(args.config)
+    in_file = path.expanduser(sheet_config.location)
+    db_file = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data',
+                        '.coordinator_{}.sqlite'.format(path.splitext(path.basename(in_file))[0]))
+
+    serve(Coordinator(db_path=db_file, total_rows=count_sheet_rows(in_file), batch_size=args.batch_size,
+                      lease_seconds=args.lease_minutes * 60),
+          host=args.host, port=args.port)
@@ -0,0 +1,49 @@
+import requests
+from requests import RequestException
+
+from lib.exceptions import ScraperException
+
+
+class CoordinatorClient(object):
+
+    """
+    Worker side of the Coordinator: leases batches of rows, heartbeats them, and reports them done
+    """
+
+    def __init__(self, url, worker, timeout=30):
+        self._url = url.rstrip('/')
+        self.worker = worker
+        self._timeout = timeout
+        self._session = requests.Session()
+
+    def _post(self, endpoint, payload):
+        payload['worker'] = self.worker
+        try:
+            response = self._session.post(self._url + endpoint, json=payload, timeout=self._timeout)
+            response.raise_for_status()
+            return response.json()
+        except (RequestException, ValueError) as e:
+            raise ScraperException('Coordinator request {} failed: {}'.format(endpoint, e))
+
+    def lease(self, min_row=1):
+        """ :return: dict with batch_id, start_row and end_row, or None when no work is left """
+        return self._post('/lease', {'min_row': min_row})['batch']
+
+    def renew(self, batch_id):
+        """ :return: False if the lease expired and was handed to another worker """
+        return self._post('/renew', {'batch_id': batch_id})['ok']
+
+    def complete(self, batch_id):
+        return self._post('/complete', {'batch_id': batch_id})['ok']
+
+    def release(self, batch_id):
+        return self._post('/release', {'batch_id': batch_id})['ok']
+
+    def status(self):
+        """ :return: dict of total, completed, leased and available batch counts """
+        try:
+            response = self._session.get(self._url + '/status', timeout=self._timeout)
+            response.raise_for_status()
+            return response.json()
+        except (RequestException, ValueError) as e:
+            raise ScraperException('Coordinator request /status failed: {}'.format(e))
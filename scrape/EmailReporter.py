@@ -85,7 +85,12 @@ class EmailReporter(object):
         subject = 'Scrape Report | {} | {}'.format(hostname, date)
         return subject
 
-    def send_report(self, metrics_dict, screenshot=None, sample_output_list=None):
+    def send_report(self, metrics_dict, screenshot=None, sample_output_list=None, log_json=None, metrics_file=None):
+        """
+        :param sample_output_list: Log lines to include in the body
+        :param log_json: Optional JSON string of structured log records (CacheLogger.to_json()), attached as a file
+        :param metrics_file: Optional path of a JSON run metrics file (PhaseTimer.write_json()) to attach
+        """
         # The character encoding for the email.
         char_set = "utf-8"
 
@@ -126,6 +131,16 @@ class EmailReporter(object):
             # Add the attachment to the parent container.
             msg.attach(att)
 
+        if log_json is not None:
+            log_att = MIMEApplication(log_json.encode(char_set), _subtype='json')
+            log_att.add_header('Content-Disposition', 'attachment', filename='log_tail.json')
+            msg.attach(log_att)
+
+        if metrics_file is not None:
+            metrics_att = MIMEApplication(open(metrics_file, 'rb').read(), _subtype='json')
+            metrics_att.add_header('Content-Disposition', 'attachment', filename=os.path.basename(metrics_file))
+            msg.attach(metrics_att)
+
         # Attach the multipart/alternative child container to the multipart/mixed
         # parent container.
         msg.attach(msg_body)
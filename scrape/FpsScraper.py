@@ -1,16 +1,24 @@
 import os
 import time
+from urllib.parse import urljoin
 
 from selenium.common.exceptions import NoSuchElementException
 
 from lib.exceptions import ScraperException
+from scrape.HtmlDocument import HtmlDocument
+from scrape.PageClassifier import PageState
 from scrape.Scraper import Scraper
 
+OPEN_REPORT_LINK_TEXT = 'VIEW FREE DETAILS'
+
 
 class FpsScraper(Scraper):
 
-    def __init__(self, logger, wait_range, chromedriver_path, time_limit=None, use_proxy=True, limit_info_grabs=9000):
-        super().__init__(logger, wait_range, chromedriver_path, time_limit, use_proxy, limit_info_grabs)
+    def __init__(self, logger, wait_range, chromedriver_path, time_limit=None, use_proxy=True, limit_info_grabs=9000,
+                 profile_dir=None, driver=None, dom_extraction='page_source', direct_reports=True,
+                 waits=None, launch_profile=None, session_port=None):
+        super().__init__(logger, wait_range, chromedriver_path, time_limit, use_proxy, limit_info_grabs, profile_dir,
+                         driver, dom_extraction, direct_reports, waits, launch_profile, session_port)
         self.root = 'https://www.fastpeoplesearch.com/'
 
         site_specific_error_strings = {'Bot Check': 'Are you human?'}
@@ -18,6 +26,7 @@ class FpsScraper(Scraper):
         # Add to the base class error dict
         for key, value in site_specific_error_strings.items():
             self._error_strings[key] = value
+        self._error_kinds['Bot Check'] = PageState.BLOCKED
 
     def login(self, cookie_file):
         return self.auto_login(cookie_file)
@@ -37,7 +46,7 @@ class FpsScraper(Scraper):
         except ScraperException as e:
             raise ScraperException('Unable to load main page: {}. {}'.format(self.root, e))
 
-    def find(self, first, last, city, state):
+    def find(self, first, last, city, state, report_urls=False):
         """
         Performs the search and filters out false positives
         :return: list of
@@ -50,7 +59,7 @@ class FpsScraper(Scraper):
         except ScraperException as e:
             raise ScraperException('Failed to load search page: {}. Error: {}'.format(search_url, e))
 
-        results_list = self._driver.find_elements_by_class_name('card-block')
+        results_list, report_links = self._read_search_results()
         for relevant_result in self._relevant_search_matches(results_list, first, last, city, state):
             matches.append(relevant_result)
 
@@ -62,14 +71,59 @@ class FpsScraper(Scraper):
         # Free memory
         del results_list
 
-        return matches
+        if report_urls:
+            return self._matched_report_urls(report_links, matches)
+
+        # Matches are clicked later, so hand back the live elements
+        if len(matches) == 0:
+            return matches
+        result_elements = self._driver.find_elements_by_class_name('card-block')
+        return [result_elements[index] for index in matches]
+
+    def _read_search_results(self):
+        """
+        :return: tuple of (list of each result card's text, list of each card's report link), in page order;
+                 report links are only read in 'page_source' mode, where they are free, and are None otherwise
+        """
+        if self._dom_extraction == 'page_source':
+            results = HtmlDocument(self._driver.page_source).find_all(class_name='card-block')
+            report_links = list()
+            for node in results:
+                # The link is upper-cased by CSS, which the raw page source doesn't have applied
+                links = [x for x in node.find_all(tag='a') if x.text.strip().lower() == OPEN_REPORT_LINK_TEXT.lower()]
+                report_links.append(links[0].attrs.get('href') if len(links) > 0 else None)
+            return [node.text for node in results], report_links
+        return [result.text for result in self._driver.find_elements_by_class_name('card-block')], None
+
+    def _matched_report_urls(self, report_links, matches):
+        """ :return: absolute report URL of each matched result """
+        if report_links is not None and None not in [report_links[index] for index in matches]:
+            matched_links = [report_links[index] for index in matches]
+        else:
+            if report_links is not None:
+                self.logger.debug('Report links missing from the page source; looking them up by element instead')
+            result_elements = self._driver.find_elements_by_class_name('card-block')
+            matched_links = [result_elements[index].find_element_by_link_text(OPEN_REPORT_LINK_TEXT)
+                             .get_attribute('href') for index in matches]
+
+        # urljoin() would turn a missing link into the search page's own URL, which never loads as a report
+        if None in matched_links:
+            raise ScraperException('Matched result has no report link; '
+                                   'use --reload-search-results to click through to reports instead.')
+
+        current_url = self._driver.current_url
+        return [urljoin(current_url, report_link) for report_link in matched_links]
 
     def _relevant_search_matches(self, results_list, first, last, city, state, fuzzy=False):
-        for result in results_list:
+        """
+        :param results_list: list of result card texts
+        :return: generator of the indexes of matching results
+        """
+        for index, result in enumerate(results_list):
             found_age = None
             found_full = None
 
-            result_text = result.text.split('\n')
+            result_text = result.split('\n')
 
             # The first line is always the simplified name (in some cases it may be the only one)
             found_simple_name = result_text.pop(0)
@@ -117,7 +171,7 @@ class FpsScraper(Scraper):
                                                                                     found_state))
 
             # Only keep 100% input matches
-            yield result
+            yield index
 
     def _has_next_page(self):
         pagination_links = self._driver.find_element_by_class_name('pagination-links')
@@ -171,66 +225,78 @@ class FpsScraper(Scraper):
     def get_info(self, search_result):
         """
         Given a search result, open its report and return the relevant information
-        :param search_result: WebElement
+        :param search_result: WebElement, or the report's URL
         :return: dict
         """
 
-        report_timeout = 180
-        main_report = None
+        report_timeout = self._waits['report_timeout']
         contact_dict = {'phone_numbers': dict(), 'email_addresses': list()}
 
-        # Big green button
-        open_report = search_result.find_element_by_link_text('VIEW FREE DETAILS')
-        open_report.click()
+        if isinstance(search_result, str):
+            self._open_report_url(search_result)
+        else:
+            # Big green button
+            open_report = search_result.find_element_by_link_text(OPEN_REPORT_LINK_TEXT)
+            open_report.click()
 
         # Verify report generation success
         countdown_begin = time.time()
-        success = False
-        while not success:
-            try:
-                main_report = self._driver.find_element_by_id('site-content')
-                success = True
-
-            # Simply waiting for the report to load...
-            except NoSuchElementException:
-                time.sleep(2)
-
-            # Generic time-out
-            if time.time() - countdown_begin > report_timeout:
-                raise ScraperException('Report failed to generate in {} seconds'.format(report_timeout))
+        main_report = self._wait_for(lambda: self._driver.find_element_by_id('site-content'), timeout=report_timeout)
+        if main_report is None:
+            raise ScraperException('Report failed to generate in {} seconds'.format(report_timeout))
 
+        self.timer.record('report_wait', time.time() - countdown_begin)
         self.logger.info('Report load successful')
         self.reports_loaded += 1
 
+        sections = self._read_report_sections(main_report)
+
         # Primary phone section (max 8 before 'Show More...')
-        try:
-            phone_card = main_report.find_element_by_class_name('detail-box-phone')
-            phone_numbers = self._parse_phone_numbers(phone_text_list=phone_card.text.split('\n'))
+        if sections['phones'] is not None:
+            phone_numbers = self._parse_phone_numbers(phone_text_list=sections['phones'].split('\n'))
             for key, value in phone_numbers.items():
                 contact_dict['phone_numbers'][key] = value
-        except NoSuchElementException:
-            pass
 
         # Paginated phone section - TODO: THIS IS BROKEN, phone_card.text is always ''; where the hell are the numbers?
-        try:
-            phone_card = main_report.find_element_by_id('collapsed-phones')
-            phone_numbers = self._parse_phone_numbers(phone_text_list=phone_card.text.split('\n'))
+        if sections['collapsed_phones'] is not None:
+            phone_numbers = self._parse_phone_numbers(phone_text_list=sections['collapsed_phones'].split('\n'))
             for key, value in phone_numbers.items():
                 contact_dict['phone_numbers'][key] = value
-        except NoSuchElementException:
-            pass
 
         # Primary email section
-        try:
-            email_card = main_report.find_element_by_class_name('detail-box-email')
-            for row in email_card.text.split('\n'):
+        if sections['emails'] is not None:
+            for row in sections['emails'].split('\n'):
                 if '@' in row:
                     contact_dict['email_addresses'].append(row)
-        except NoSuchElementException:
-            pass
 
         return contact_dict
 
+    def _read_report_sections(self, main_report):
+        """
+        :param main_report: the report's WebElement, only used by the 'elements' extraction mode
+        :return: dict of 'phones', 'collapsed_phones' and 'emails' section text; None for a missing section
+        """
+        if self._dom_extraction == 'page_source':
+            report = HtmlDocument(self._driver.page_source).find(element_id='site-content')
+            phone_card = report.find(class_name='detail-box-phone')
+            email_card = report.find(class_name='detail-box-email')
+
+            # Page source has no CSS applied, so the hidden collapsed section would not read as it does in the
+            # browser (where it is always empty); leave it out rather than parse text of an unknown format
+            return {'phones': phone_card.text if phone_card is not None else None,
+                    'collapsed_phones': None,
+                    'emails': email_card.text if email_card is not None else None}
+
+        sections = dict()
+        for section, find_element, locator in (('phones', main_report.find_element_by_class_name, 'detail-box-phone'),
+                                               ('collapsed_phones', main_report.find_element_by_id, 'collapsed-phones'),
+                                               ('emails', main_report.find_element_by_class_name, 'detail-box-email')):
+            try:
+                sections[section] = find_element(locator).text
+            except NoSuchElementException:
+                sections[section] = None
+        return sections
+
     @staticmethod
     def _parse_phone_numbers(phone_text_list):
         parsed_numbers = dict()
@@ -0,0 +1,103 @@
+from html.parser import HTMLParser
+
+# Tags rendered on their own line(s) by Chrome, for WebElement.text-like output
+BLOCK_TAGS = {'address', 'article', 'br', 'dd', 'div', 'dl', 'dt', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+              'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'section', 'table', 'tr', 'ul'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+
+class HtmlNode(object):
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = list()
+
+    @property
+    def classes(self):
+        return self.attrs.get('class', '').split()
+
+    def iter_descendants(self):
+        for child in self.children:
+            if isinstance(child, HtmlNode):
+                yield child
+                yield from child.iter_descendants()
+
+    def find_all(self, class_name=None, element_id=None, tag=None):
+        return [node for node in self.iter_descendants()
+                if (class_name is None or class_name in node.classes) and
+                (element_id is None or node.attrs.get('id') == element_id) and
+                (tag is None or node.tag == tag)]
+
+    def find(self, class_name=None, element_id=None, tag=None):
+        """ :return: first matching descendant, or None """
+        for node in self.iter_descendants():
+            if (class_name is None or class_name in node.classes) and \
+                    (element_id is None or node.attrs.get('id') == element_id) and \
+                    (tag is None or node.tag == tag):
+                return node
+        return None
+
+    @property
+    def text(self):
+        """ Text content with a line break around each block element, like WebElement.text; CSS is not applied """
+        pieces = list()
+        self._collect_text(pieces)
+        lines = ''.join(pieces).split('\n')
+        return '\n'.join(line for line in (' '.join(line.split()) for line in lines) if line)
+
+    def _collect_text(self, pieces):
+        if self.tag in ('script', 'style', 'head'):
+            return
+        if self.tag in BLOCK_TAGS:
+            pieces.append('\n')
+        for child in self.children:
+            if isinstance(child, HtmlNode):
+                child._collect_text(pieces)
+            else:
+                pieces.append(child)
+        if self.tag in BLOCK_TAGS:
+            pieces.append('\n')
+
+
+class HtmlDocument(HTMLParser):
+
+    """
+    Parses a page's source once into a light tree of HtmlNodes, so every field on a page can be read
+    from a single WebDriver round trip (driver.page_source) instead of one round trip per element.
+    """
+
+    def __init__(self, source):
+        super().__init__(convert_charrefs=True)
+        self.root = HtmlNode('#document', dict())
+        self._current = self.root
+        self.feed(source)
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        node = HtmlNode(tag, {key: value if value is not None else '' for key, value in attrs}, parent=self._current)
+        self._current.children.append(node)
+        if tag not in VOID_TAGS:
+            self._current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self._current.children.append(HtmlNode(tag, {key: value if value is not None else '' for key, value in attrs},
+                                               parent=self._current))
+
+    def handle_endtag(self, tag):
+        # Tolerate unclosed tags by unwinding to the nearest matching open element
+        node = self._current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self._current = node.parent
+
+    def handle_data(self, data):
+        self._current.children.append(data)
+
+    def find_all(self, class_name=None, element_id=None, tag=None):
+        return self.root.find_all(class_name=class_name, element_id=element_id, tag=tag)
+
+    def find(self, class_name=None, element_id=None, tag=None):
+        return self.root.find(class_name=class_name, element_id=element_id, tag=tag)
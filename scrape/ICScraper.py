@@ -1,18 +1,23 @@
 import time
-from datetime import datetime
+from urllib.parse import urljoin
 
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.keys import Keys
 
 from lib.exceptions import ScraperException
+from scrape.HtmlDocument import HtmlDocument
+from scrape.PageClassifier import PageState
 from scrape.Scraper import Scraper
 from scrape.util import get_config
 
 
 class ICScraper(Scraper):
 
-    def __init__(self, logger, wait_range, chromedriver_path, time_limit=None, use_proxy=False, limit_info_grabs=9000):
-        super().__init__(logger, wait_range, chromedriver_path, time_limit, use_proxy, limit_info_grabs)
+    def __init__(self, logger, wait_range, chromedriver_path, time_limit=None, use_proxy=False, limit_info_grabs=9000,
+                 profile_dir=None, driver=None, dom_extraction='page_source', direct_reports=True,
+                 waits=None, launch_profile=None, session_port=None):
+        super().__init__(logger, wait_range, chromedriver_path, time_limit, use_proxy, limit_info_grabs, profile_dir,
+                         driver, dom_extraction, direct_reports, waits, launch_profile, session_port)
         self.root = 'https://www.instantcheckmate.com/dashboard'
 
         site_specific_error_strings = {'404 Error': 'Uh Oh! Looks like something went wrong.',
@@ -23,6 +28,8 @@ class ICScraper(Scraper):
         # Add to the base class error dict
         for key, value in site_specific_error_strings.items():
             self._error_strings[key] = value
+        self._error_kinds['404 Error'] = PageState.BROKEN
+        self._error_kinds['500 Error'] = PageState.BROKEN
 
     def login(self, cookie_file):
         return self.manual_login(cookie_file)
@@ -34,6 +41,10 @@ class ICScraper(Scraper):
         """
         login_url = self.root + '/login'
 
+        if self.launch_profile.headless:
+            self.logger.warning('Headless browser: login can only succeed from saved session cookies, '
+                                'nobody can log in or clear a Captcha')
+
         self.load_session_cookies(cookie_file)
 
         try:
@@ -47,18 +58,16 @@ class ICScraper(Scraper):
         #     self._driver.refresh()
 
         # Verify login success
-        success = False
-        while not success:
+        def logged_in_or_gateway_timeout():
             try:
-                self._driver.find_element_by_id('report-history')
-                success = True
+                return self._driver.find_element_by_id('report-history')
             except NoSuchElementException:
-                if self._error_strings['504 Error'] in self._driver.page_source:
-                    self.logger.error('504 Error detected.')
-                    self._driver.refresh()
-                    self.random_sleep((0, 20))
-                else:
-                    time.sleep(2)
+                return self._classify_page().error == '504 Error'
+
+        while self._wait_for(logged_in_or_gateway_timeout, poll_interval=self._waits['login_poll_interval']) is True:
+            self.logger.error('504 Error detected.')
+            self._driver.refresh()
+            self.random_sleep((0, 20))
 
         self.logger.info('Login successful')
         self.save_session_cookies(cookie_file)
@@ -73,7 +82,7 @@ class ICScraper(Scraper):
         :return:
         """
         # This needs to be a fair bit of time because these captchas are FUCKING IMPOSSIBLE TO SOLVE
-        captcha_timeout = 360
+        captcha_timeout = self._waits['captcha_timeout']
         config = get_config(config_path=config_path)
         login_url = self.root + '/login'
         try:
@@ -89,19 +98,12 @@ class ICScraper(Scraper):
         pass_input.send_keys(Keys.RETURN)
 
         # MANUAL CAPTCHA RESOLUTION REQUIRED
-        countdown_begin = time.time()
         self.logger.warning('You have {} seconds to clear all Captchas!'.format(captcha_timeout))
 
         # Verify login success
-        success = False
-        while not success:
-            try:
-                self._driver.find_element_by_id('report-history')
-                success = True
-            except NoSuchElementException:
-                time.sleep(2)
-            if time.time() - countdown_begin > captcha_timeout:
-                raise ScraperException('Captcha not cleared in time')
+        if self._wait_for(lambda: self._driver.find_element_by_id('report-history'), timeout=captcha_timeout,
+                          poll_interval=self._waits['login_poll_interval']) is None:
+            raise ScraperException('Captcha not cleared in time')
 
         self.logger.info('Login successful')
 
@@ -132,7 +134,7 @@ class ICScraper(Scraper):
             return False
         return True
 
-    def find(self, first, last, city, state):
+    def find(self, first, last, city, state, report_urls=False):
         matches = list()
         captcha_detected = False
 
@@ -142,16 +144,20 @@ class ICScraper(Scraper):
         except ScraperException as e:
             raise ScraperException('Failed to load search page: {}. Error: {}'.format(search_url, e))
 
-        while self._detect_login_page() and (self._time_limit is None or datetime.now() < self._time_limit):
-            time.sleep(5)
         if self._detect_login_page():
-            return ScraperException('Account logged out. Discontinuing scrape.')
+            with self.timer.time('login_wait'):
+                self._wait_for(lambda: not self._detect_login_page(), timeout=self._seconds_until_time_limit(),
+                               poll_interval=self._waits['login_poll_interval'])
+            if self._detect_login_page():
+                return ScraperException('Account logged out. Discontinuing scrape.')
 
-        while self._detect_captcha() and (self._time_limit is None or datetime.now() < self._time_limit):
-            captcha_detected = True
-            time.sleep(60)
         if self._detect_captcha():
-            return ScraperException('Captcha detected. Discontinuing scrape.')
+            captcha_detected = True
+            with self.timer.time('captcha_wait'):
+                self._wait_for(lambda: not self._detect_captcha(), timeout=self._seconds_until_time_limit(),
+                               poll_interval=self._waits['captcha_poll_interval'])
+            if self._detect_captcha():
+                return ScraperException('Captcha detected. Discontinuing scrape.')
 
         # Reload the search page after Captcha has been cleared
         if captcha_detected:
@@ -160,14 +166,14 @@ class ICScraper(Scraper):
             except ScraperException as e:
                 raise ScraperException('Failed to load search page: {}. Error: {}'.format(search_url, e))
 
-        results_list = self._driver.find_elements_by_class_name('result')
+        results_list = self._read_search_results()
 
-        for result in results_list:
-            found_first = result.get_attribute('data-first-name')
-            found_last = result.get_attribute('data-last-name')
-            found_full = result.get_attribute('data-full-name')
-            found_city = result.get_attribute('data-location')
-            found_age = result.get_attribute('data-age')
+        for index, result in enumerate(results_list):
+            found_first = result['first']
+            found_last = result['last']
+            found_full = result['full']
+            found_city = result['location']
+            found_age = result['age']
 
             # Basic validation against canonical search params
             if found_first.lower() != first.lower() or \
@@ -179,96 +185,148 @@ class ICScraper(Scraper):
                 continue
 
             # Secondary validation to make sure the most recent location matches the input city
-            locations_list = result.find_elements_by_class_name('person-location')
+            locations_list = result['locations']
 
             # No cities listed
             if len(locations_list) == 0:
                 continue
 
             # First listed city does not match
-            # if locations_list[0].text.split(',')[0].lower() != city.lower():
+            # if locations_list[0].split(',')[0].lower() != city.lower():
             #     continue
 
             # City is not in the listed locations
-            if city.lower() not in [x.text.split(',')[0].lower() for x in locations_list]:
+            if city.lower() not in [x.split(',')[0].lower() for x in locations_list]:
                 continue
 
             self.logger.info('Result: {}, Age: {}, City: {}'.format(found_full, found_age, found_city))
 
             # Only keep 100% input matches
-            matches.append(result)
+            matches.append(index)
+
+        if report_urls:
+            return self._matched_report_urls(results_list, matches)
 
         # Free memory
         del results_list
 
-        return matches
+        # Matches are clicked later, so hand back the live elements
+        if len(matches) == 0:
+            return matches
+        result_elements = self._driver.find_elements_by_class_name('result')
+        return [result_elements[index] for index in matches]
+
+    def _matched_report_urls(self, results_list, matches):
+        """ :return: absolute report URL of each matched result """
+        report_urls = [results_list[index]['report_url'] for index in matches]
+
+        # Only read from the page source; look the links up element by element otherwise
+        if None in report_urls:
+            result_elements = self._driver.find_elements_by_class_name('result')
+            report_urls = [result_elements[index].find_element_by_class_name('view-report').get_attribute('href')
+                           for index in matches]
+
+        # urljoin() would turn a missing link into the search page's own URL, which never loads as a report
+        if None in report_urls:
+            raise ScraperException('Matched result has no report link; '
+                                   'use --reload-search-results to click through to reports instead.')
+
+        current_url = self._driver.current_url
+        return [urljoin(current_url, report_url) for report_url in report_urls]
+
+    def _read_search_results(self):
+        """
+        :return: list of dicts (first, last, full, location, age, locations, report_url), one per result card,
+                 in page order; report_url is only read in 'page_source' mode, where it is free
+        """
+        results = list()
+
+        if self._dom_extraction == 'page_source':
+            for node in HtmlDocument(self._driver.page_source).find_all(class_name='result'):
+                open_report_button = node.find(class_name='view-report')
+                results.append({'first': node.attrs.get('data-first-name'),
+                                'last': node.attrs.get('data-last-name'),
+                                'full': node.attrs.get('data-full-name'),
+                                'location': node.attrs.get('data-location'),
+                                'age': node.attrs.get('data-age'),
+                                'locations': [x.text for x in node.find_all(class_name='person-location')],
+                                'report_url': open_report_button.attrs.get('href')
+                                if open_report_button is not None else None})
+            return results
+
+        for result in self._driver.find_elements_by_class_name('result'):
+            results.append({'first': result.get_attribute('data-first-name'),
+                            'last': result.get_attribute('data-last-name'),
+                            'full': result.get_attribute('data-full-name'),
+                            'location': result.get_attribute('data-location'),
+                            'age': result.get_attribute('data-age'),
+                            'locations': [x.text for x in result.find_elements_by_class_name('person-location')],
+                            'report_url': None})
+        return results
 
     def get_info(self, search_result):
         """
         Given a search, open its report and return the relevant information
-        :param search_result: WebElement
+        :param search_result: WebElement, or the report's URL
         :return: dict
         """
 
-        report_timeout = 180
-        main_report = None
+        report_timeout = self._waits['report_timeout']
         contact_dict = {'phone_numbers': dict(), 'email_addresses': list()}
-        captcha_detected = False
 
-        self._click_the_button(search_result)
+        if isinstance(search_result, str):
+            self._open_report_url(search_result)
+        else:
+            self._click_the_button(search_result)
 
         if self._detect_login_page():
             return ScraperException('Account logged out. Discontinuing scrape.')
 
         # TODO: This is not working
-        while self._detect_captcha() and (self._time_limit is None or datetime.now() < self._time_limit):
-            time.sleep(60)
         if self._detect_captcha():
-            return ScraperException('Captcha detected. Discontinuing scrape.')
+            with self.timer.time('captcha_wait'):
+                self._wait_for(lambda: not self._detect_captcha(), timeout=self._seconds_until_time_limit(),
+                               poll_interval=self._waits['captcha_poll_interval'])
+            if self._detect_captcha():
+                return ScraperException('Captcha detected. Discontinuing scrape.')
+
+        # Wait for either the report or an error page
+        def report_or_error():
+            try:
+                return self._driver.find_element_by_id('main-report')
+            except NoSuchElementException:
+                page = self._classify_page()
+                return page if not page.ok else None
 
         # Verify report generation success
         countdown_begin = time.time()
-        success = False
         # TODO: dismiss tutorial overlay if it occurs
-        while not success:
-            try:
-                main_report = self._driver.find_element_by_id('main-report')
-                success = True
+        main_report = self._wait_for(report_or_error, timeout=report_timeout)
+        if main_report is None:
+            raise ScraperException('Report failed to generate in {} seconds'.format(report_timeout))
+        page = main_report if isinstance(main_report, PageState) else self._classify_page()
 
-            # Simply waiting for the report to load...
-            except NoSuchElementException:
-                self.logger.error('Unable to find main-report element.')
-
-            # Loaded an error page instead of a report
-            for error, message in self._error_strings.items():
-                if message in self._driver.page_source:
-
-                    # Something is wrong with this particular report, probably server-side
-                    if error in ('500 Error', '404 Error'):
-                        self.logger.error('Report broken; {} detected.'.format(error))
+        # Loaded an error page instead of a report
+        if not page.ok:
 
-                        # Call it a loss and move on
-                        return contact_dict
+            # Something is wrong with this particular report, probably server-side
+            if page.kind == PageState.BROKEN:
+                self.logger.error('Report broken; {} detected.'.format(page.error))
 
-                    self.logger.error('{} detected.'.format(error))
-                    # TODO: wait, why am I returning an error string?
-                    return error
+                # Call it a loss and move on
+                return contact_dict
 
-            # Generic time-out
-            if time.time() - countdown_begin > report_timeout:
-                raise ScraperException('Report failed to generate in {} seconds'.format(report_timeout))
+            self.logger.error('{} detected.'.format(page.error))
+            # TODO: wait, why am I returning an error string?
+            return page.error
 
+        self.timer.record('report_wait', time.time() - countdown_begin)
         self.logger.info('Report load successful')
         self.reports_loaded += 1
 
-        phone_rows = main_report.find_elements_by_class_name('phone-row')
-        for row in phone_rows:
-            phone_number = row.find_element_by_class_name('usage-phone-number').text
-            try:
-                phone_type = row.find_element_by_class_name('usage-line-type').text
-            except NoSuchElementException:
-                phone_type = 'unknown'
+        phone_rows, email_addresses = self._read_report(main_report, page_source=page.source)
 
+        for phone_number, phone_type in phone_rows:
             # Skip undesirable numbers
             # if phone_type.lower() in ('fax', 'voip', 'landline', 'unknown'):
             if phone_type.lower() == 'fax':
@@ -276,17 +334,54 @@ class ICScraper(Scraper):
 
             contact_dict['phone_numbers'][phone_number] = phone_type
 
-        email_rows = main_report.find_elements_by_class_name('email-usage')
-        for row in email_rows:
-            remove_button = row.find_element_by_class_name('remove')
-            email_address = remove_button.get_attribute('data-source')
-            contact_dict['email_addresses'].append(email_address)
+        contact_dict['email_addresses'].extend(email_addresses)
 
         return contact_dict
 
-    @staticmethod
-    def _click_the_button(search_result):
-        # Big green button
-        time.sleep(5)
-        open_report_button = search_result.find_element_by_class_name('view-report')
+    def _read_report(self, main_report, page_source=None):
+        """
+        :param main_report: the report's WebElement, only used by the 'elements' extraction mode
+        :param page_source: the report page's source, if already fetched
+        :return: tuple of ([(phone number, line type)], [email address])
+        """
+        phone_rows = list()
+        email_addresses = list()
+
+        if self._dom_extraction == 'page_source':
+            if page_source is None:
+                page_source = self._driver.page_source
+            report = HtmlDocument(page_source).find(element_id='main-report')
+            for row in report.find_all(class_name='phone-row'):
+                number_node = row.find(class_name='usage-phone-number')
+                if number_node is None:
+                    continue
+                type_node = row.find(class_name='usage-line-type')
+                phone_rows.append((number_node.text, type_node.text if type_node is not None else 'unknown'))
+            for row in report.find_all(class_name='email-usage'):
+                remove_button = row.find(class_name='remove')
+                if remove_button is not None:
+                    email_addresses.append(remove_button.attrs.get('data-source'))
+            return phone_rows, email_addresses
+
+        for row in main_report.find_elements_by_class_name('phone-row'):
+            phone_number = row.find_element_by_class_name('usage-phone-number').text
+            try:
+                phone_type = row.find_element_by_class_name('usage-line-type').text
+            except NoSuchElementException:
+                phone_type = 'unknown'
+            phone_rows.append((phone_number, phone_type))
+
+        for row in main_report.find_elements_by_class_name('email-usage'):
+            remove_button = row.find_element_by_class_name('remove')
+            email_addresses.append(remove_button.get_attribute('data-source'))
+
+        return phone_rows, email_addresses
+
+    def _click_the_button(self, search_result):
+        # Big green button; click as soon as it can be clicked
+        open_report_button = self._wait_for(
+            lambda: self._clickable(search_result.find_element_by_class_name('view-report')),
+            timeout=self._waits['element_timeout'])
+        if open_report_button is None:
+            raise ScraperException('Report button never became clickable')
         open_report_button.click()
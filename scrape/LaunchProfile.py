@@ -0,0 +1,90 @@
+from selenium import webdriver
+
+from lib.exceptions import ScraperException
+
+# Chrome DevTools Network.setBlockedURLs patterns ('*' is the only wildcard)
+FONT_URL_PATTERNS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*fonts.googleapis.com*', '*fonts.gstatic.com*']
+TRACKER_URL_PATTERNS = ['*google-analytics.com*', '*googletagmanager.com*', '*googleadservices.com*',
+                        '*googlesyndication.com*', '*doubleclick.net*', '*connect.facebook.net*', '*hotjar.com*',
+                        '*bat.bing.com*', '*quantserve.com*', '*scorecardresearch.com*', '*adsrvr.org*',
+                        '*criteo.com*', '*taboola.com*', '*outbrain.com*', '*clarity.ms*']
+
+
+class LaunchProfile(object):
+
+    """
+    How Chrome is launched for scraping. Everything is off by default, which is a plain graphical Chrome as a person
+    would use it; headless and resource blocking only suit sites and runs that never need a person at the browser
+    (IC logins and Captchas do).
+
+    :param settings: dict overriding any of DEFAULTS, e.g. a site's 'browser' entry in the run config:
+      headless            no window; no VNC desktop needed
+      block_images        don't download images
+      block_fonts         don't download web fonts
+      block_trackers      don't load analytics/ad scripts (TRACKER_URL_PATTERNS)
+      disable_extensions  no extensions, component extensions or background apps
+      reuse_profile       keep the Chrome profile (cache, cookies) between runs, even with a single browser
+      window_size         [width, height]; headless Chrome otherwise renders at 800x600
+    """
+
+    DEFAULTS = {'headless': False,
+                'block_images': False,
+                'block_fonts': False,
+                'block_trackers': False,
+                'disable_extensions': False,
+                'reuse_profile': False,
+                'window_size': [1920, 1080]}
+
+    def __init__(self, settings=None):
+        self._settings = dict(LaunchProfile.DEFAULTS)
+        for key, value in (settings or dict()).items():
+            if key not in LaunchProfile.DEFAULTS:
+                raise ScraperException('Unknown browser launch setting: {}'.format(key))
+            self._settings[key] = value
+
+    @property
+    def headless(self):
+        return self._settings['headless']
+
+    @property
+    def reuse_profile(self):
+        return self._settings['reuse_profile']
+
+    def chrome_options(self, profile_dir=None):
+        """ :return: webdriver.ChromeOptions for this profile """
+        options = webdriver.ChromeOptions()
+
+        # A dedicated Chrome profile lets several browsers run side by side without sharing session state
+        if profile_dir is not None:
+            options.add_argument('--user-data-dir={}'.format(profile_dir))
+
+        if self._settings['headless']:
+            options.add_argument('--headless')
+            options.add_argument('--disable-gpu')
+            options.add_argument('--window-size={},{}'.format(*self._settings['window_size']))
+
+        if self._settings['block_images']:
+            options.add_argument('--blink-settings=imagesEnabled=false')
+            options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+        if self._settings['disable_extensions']:
+            options.add_argument('--disable-extensions')
+            options.add_argument('--disable-component-extensions-with-background-pages')
+            options.add_argument('--disable-background-networking')
+
+        return options
+
+    def blocked_url_patterns(self):
+        patterns = list()
+        if self._settings['block_fonts']:
+            patterns.extend(FONT_URL_PATTERNS)
+        if self._settings['block_trackers']:
+            patterns.extend(TRACKER_URL_PATTERNS)
+        return patterns
+
+    def apply(self, driver):
+        """ Settings that can only be set on a running browser, over the DevTools protocol """
+        patterns = self.blocked_url_patterns()
+        if len(patterns) > 0:
+            driver.execute_cdp_cmd('Network.enable', dict())
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
@@ -0,0 +1,56 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MetricsServer(object):
+
+    """
+    Serves live run metrics in the Prometheus text exposition format at /metrics, from a background thread.
+    collect() is only called when the endpoint is scraped, and must just read current values, never wait on the
+    scrape loop; it returns a list of (name, type, help, value) tuples.
+    """
+
+    def __init__(self, collect, port, host='localhost'):
+        self._collect = collect
+        self.port = port
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    def render(self):
+        lines = list()
+        for name, metric_type, help_text, value in self._collect():
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.append('{} {}'.format(name, 'NaN' if value is None else value))
+        return '\n'.join(lines) + '\n'
+
+    def start(self):
+        metrics_server = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics_server.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Keep scrapes of the endpoint out of the run's console output
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
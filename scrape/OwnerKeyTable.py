@@ -0,0 +1,83 @@
+from array import array
+
+
+class OwnerKeyTable(object):
+
+    """
+    Every owner search of an input sheet, normalized once up front and held column-wise: each unique
+    (first, last, city, state) search key gets an integer code, and an array holds the code of every owner column
+    group of every row (row-major, -1 for a group with no name to search), so the scrape loop never re-normalizes
+    or re-hashes row values.
+
+    :param column_dict: dict as returned by get_columns()
+    """
+
+    def __init__(self, column_dict):
+        self._column_dict = column_dict
+        self.group_count = column_dict['count']
+
+        # Unique search keys in first-reference order; a key's code is its index here
+        self.keys = list()
+
+        # Number of (included) row references to each key, by code
+        self.references = array('l')
+
+        # Code of each owner column group of each row; row-major
+        self.codes = array('l')
+
+        self._key_codes = dict()
+
+    def load(self, rows, include_row):
+        """
+        :param rows: iterable of dicts from a csv.DictReader
+        :param include_row: function(row) -> bool; rows it rejects get no codes (-1) and add no references
+        :return: self
+        """
+        column_names = set()
+        for key in ('first_names', 'last_names', 'cities', 'states'):
+            column_names.update(self._column_dict[key])
+        column_names = sorted(column_names)
+
+        # Stream the sheet once, normalizing each used column's values into its own list as rows go by; excluded rows
+        # contribute blanks. A city/state column shared by every owner group is normalized once per row rather than
+        # once per group.
+        columns = {name: list() for name in column_names}
+        appends = [(columns[name].append, name) for name in column_names]
+        for row in rows:
+            if include_row(row):
+                for append, name in appends:
+                    append(row[name].strip().upper())
+            else:
+                for append, name in appends:
+                    append('')
+
+        group_keys = [zip(columns[self._column_dict['first_names'][index]],
+                          columns[self._column_dict['last_names'][index]],
+                          columns[self._column_dict['cities'][index]],
+                          columns[self._column_dict['states'][index]])
+                      for index in range(self.group_count)]
+
+        # Intern row by row, so codes (and the keys list) follow first-reference order through the sheet
+        for row_keys in zip(*group_keys):
+            for search_key in row_keys:
+                if search_key[0] == '' or search_key[1] == '':
+                    self.codes.append(-1)
+                    continue
+                code = self._key_codes.get(search_key)
+                if code is None:
+                    code = len(self.keys)
+                    self._key_codes[search_key] = code
+                    self.keys.append(search_key)
+                    self.references.append(0)
+                self.references[code] += 1
+                self.codes.append(code)
+
+        return self
+
+    def row_codes(self, row_position):
+        """ :return: codes of the row's owner column groups, -1 where there is nothing to search """
+        start = row_position * self.group_count
+        return self.codes[start:start + self.group_count]
+
+    def reference_count(self):
+        return sum(self.references)
@@ -0,0 +1,155 @@
+import fcntl
+import json
+import os
+import time
+
+from lib.AtomicCsvWriter import FSYNC_INTERVAL_SECONDS
+from lib.exceptions import RowJournalException
+
+
+class RowJournal(object):
+
+    """
+    Append-only journal of completed output rows, one JSON line per row, in input order.
+    It is fsynced periodically, so after a crash or reboot a run can be resumed at the last committed row
+    without loading any report twice. A torn final line is discarded on resume.
+
+    A row already committed can be replaced later (e.g. a coordinator batch reclaimed behind this host's cursor and
+    scraped in another pass) by a revision line, [row number, row]; replay() yields the revised row in its place.
+    """
+
+    def __init__(self, journal_path, fsync_interval=FSYNC_INTERVAL_SECONDS):
+        self.path = journal_path
+        self._fsync_interval = fsync_interval
+        self._file = None
+        self._lock_file = None
+        self._last_fsync = None
+        self.committed_rows = 0
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def lock(self):
+        """ Claim the journal for this process; a second scrape of the same sheet on this host is refused """
+        self._lock_file = open('{}.lock'.format(self.path), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise RowJournalException('Another scrape of this sheet is already running on this host '
+                                      '(journal: {}).'.format(self.path))
+
+    def worker_id(self, new_id, reuse=False):
+        """
+        Coordinator worker id of the run writing this journal, stored beside it
+        :param new_id: id to store and use for a fresh run
+        :param reuse: keep the stored id, if there is one, so a resumed run leases its unfinished batch back
+        :return: the worker id
+        """
+        id_path = '{}.worker'.format(self.path)
+        if reuse and os.path.isfile(id_path):
+            with open(id_path, 'r') as f:
+                stored_id = f.read().strip()
+            if stored_id:
+                return stored_id
+        with open(id_path, 'w') as f:
+            f.write(new_id + '\n')
+        return new_id
+
+    def read_lines(self, offset=0):
+        """
+        Yield (end offset, parsed line) for every complete line from the byte offset on, stopping at the first torn one.
+        Safe to call while the journal is being appended to; lines not yet flushed are simply not there yet.
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    return
+                yield f.tell(), entry
+
+    def load(self, fieldnames):
+        """
+        Validate an existing journal against the output columns and drop any torn tail
+        :return: number of committed rows
+        """
+        committed_rows = 0
+        good_offset = 0
+        header_checked = False
+
+        for offset, entry in self.read_lines():
+            if not header_checked:
+                if entry.get('fieldnames') != list(fieldnames):
+                    raise RowJournalException('Journal {} was written for different columns; '
+                                              'it can not be resumed.'.format(self.path))
+                header_checked = True
+            elif isinstance(entry, dict):
+                committed_rows += 1
+            good_offset = offset
+
+        if not header_checked:
+            raise RowJournalException('Journal {} has no readable header.'.format(self.path))
+
+        # Anything past the last complete line is a partial write from the interruption
+        with open(self.path, 'r+b') as f:
+            f.truncate(good_offset)
+
+        self.committed_rows = committed_rows
+        return committed_rows
+
+    def replay(self):
+        """ Yield every committed row dict, in order, with its latest revision if it has any """
+        if self.committed_rows == 0:
+            return
+        revisions = {entry[0]: entry[1] for offset, entry in self.read_lines() if isinstance(entry, list)}
+        row_number = 0
+        for index, (offset, entry) in enumerate(self.read_lines()):
+            if index == 0 or not isinstance(entry, dict):
+                continue
+            row_number += 1
+            if row_number > self.committed_rows:
+                return
+            yield revisions.get(row_number, entry)
+
+    def open(self, fieldnames, append=False):
+        """ Start a fresh journal, or append to a loaded one """
+        if append:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(json.dumps({'fieldnames': list(fieldnames)}) + '\n')
+            self.committed_rows = 0
+            self._sync()
+        self._last_fsync = time.time()
+
+    def record(self, row):
+        """ Append one completed output row """
+        self._file.write(json.dumps(row) + '\n')
+        self.committed_rows += 1
+        if time.time() - self._last_fsync >= self._fsync_interval:
+            self._sync()
+
+    def record_revision(self, row_number, row):
+        """ Replace the already committed row at row_number (1-based) """
+        self._file.write(json.dumps([row_number, row]) + '\n')
+        if time.time() - self._last_fsync >= self._fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.time()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._sync()
+            self._file.close()
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
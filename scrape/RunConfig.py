@@ -14,8 +14,12 @@ class RunConfig(object):
         self.wait_range_between_rows = 0
         self.wait_range_between_report_loads = 0
         self.upload_bucket = None
+        self.upload_endpoint_url = None
         self.email_sender = None
         self.email_recipient = None
+        self.search_cache_ttl_days = None
+        self.waits = None
+        self.browser = None
 
         self._load_config_json()
 
@@ -37,3 +41,10 @@ class RunConfig(object):
             self.upload_bucket = config_dict['upload_bucket']
             self.email_sender = config_dict['email']['sender']
             self.email_recipient = config_dict['email']['recipient']
+
+            # Optional
+            self.waits = config_dict['sites'][self._site_key].get('waits')
+            self.browser = config_dict['sites'][self._site_key].get('browser')
+            self.upload_endpoint_url = config_dict.get('upload_endpoint_url')
+            if 'search_cache' in config_dict.keys():
+                self.search_cache_ttl_days = config_dict['search_cache'].get('ttl_days')
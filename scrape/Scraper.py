@@ -1,27 +1,86 @@
 import pickle
 import random
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from os import path
+from urllib.parse import urlparse
 
 from selenium import webdriver
-from selenium.common.exceptions import InvalidArgumentException, WebDriverException
+from selenium.common.exceptions import InvalidArgumentException, InvalidCookieDomainException, \
+    NoSuchElementException, TimeoutException, WebDriverException
+from selenium.webdriver.support.wait import WebDriverWait
 
+from lib.PhaseTimer import PhaseTimer
 from lib.exceptions import ScraperException
+from scrape.BrowserSessions import BrowserSessions
+from scrape.LaunchProfile import LaunchProfile
+from scrape.PageClassifier import PageClassifier, PageState
 from scrape.TorProxy import check_ip, TorProxy
 
+# How search results and reports are read: the whole page source in one WebDriver round trip,
+# or the legacy element-by-element lookups (one round trip per field)
+DOM_EXTRACTION_MODES = ('page_source', 'elements')
 
-class Scraper(object):
+# Cookie fields WebDriver's add_cookie() accepts
+COOKIE_KEYS = ('name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry', 'sameSite')
 
-    def __init__(self, logger, wait_range, chromedriver_path, time_limit=None, use_proxy=False, limit_info_grabs=42):
+# Seconds; override any of them per site with a 'waits' dict in the run config
+DEFAULT_WAITS = {'poll_interval': 0.5,              # page elements: reports, buttons
+                 'element_timeout': 30,
+                 'report_timeout': 180,
+                 'login_poll_interval': 2,          # waiting on a person to log in
+                 'captcha_poll_interval': 5,        # waiting on a person to clear a Captcha
+                 'captcha_timeout': 360}
 
-        self.logger = logger
 
-        self._driver = webdriver.Chrome(executable_path=chromedriver_path)
-        self.logger.debug('Chrome spawned at {}'.format(datetime.now()))
+class Scraper(object):
+
+    def __init__(self, logger, wait_range, chromedriver_path, time_limit=None, use_proxy=False, limit_info_grabs=42,
+                 profile_dir=None, driver=None, dom_extraction='page_source', direct_reports=True, waits=None,
+                 launch_profile=None, session_port=None):
 
-        self.ip = check_ip(self._driver)
-        self.logger.debug('Your IP: {}'.format(self.ip))
+        self.logger = logger
+        self.launch_profile = launch_profile if launch_profile is not None else LaunchProfile()
+
+        self._waits = dict(DEFAULT_WAITS)
+        for key, value in (waits or dict()).items():
+            if key not in DEFAULT_WAITS:
+                raise ScraperException('Unknown wait setting: {}'.format(key))
+            self._waits[key] = value
+
+        if dom_extraction not in DOM_EXTRACTION_MODES:
+            raise ScraperException('Unknown DOM extraction mode: {}'.format(dom_extraction))
+        self._dom_extraction = dom_extraction
+
+        # DevTools port of a Chrome kept running between runs (see BrowserSessions), if any
+        self._session_port = session_port
+
+        if driver is None and session_port is not None and BrowserSessions.is_alive(session_port):
+            self._driver = webdriver.Chrome(executable_path=chromedriver_path,
+                                            options=BrowserSessions.attach_options(session_port))
+            self.launch_profile.apply(self._driver)
+            self.logger.info('Attached to running Chrome on port {}'.format(session_port))
+            self.ip = None
+
+        elif driver is None:
+            options = self.launch_profile.chrome_options(
+                profile_dir=path.expanduser(profile_dir) if profile_dir is not None else None)
+            if session_port is not None:
+                BrowserSessions.keep_alive(options, session_port)
+            self._driver = webdriver.Chrome(executable_path=chromedriver_path, options=options)
+            self.launch_profile.apply(self._driver)
+            self.logger.debug('Chrome spawned at {}'.format(datetime.now()))
+
+            # Only needed to confirm a proxy took effect; spares a page load per launch otherwise
+            self.ip = None
+            if use_proxy:
+                self.ip = check_ip(self._driver)
+                self.logger.debug('Your IP: {}'.format(self.ip))
+
+        # An already running driver, e.g. pointed at saved pages for offline replay; no live IP check
+        else:
+            self._driver = driver
+            self.ip = None
 
         self._use_proxy = use_proxy
         if use_proxy:
@@ -38,16 +97,32 @@ class Scraper(object):
         # Maximum number of emails or phone numbers to grab per search
         self._limit_info_grabs = limit_info_grabs
 
-        # Internal metric
+        # Open each matched report by the URL captured from the search page, instead of reloading the search
+        # results after every report to get fresh (non-stale) elements to click
+        self._direct_reports = direct_reports
+
+        # Internal metrics
         self.reports_loaded = 0
+        self.timer = PhaseTimer()
+
+        # End of the current random_sleep(), if any; read by the live metrics endpoint
+        self.sleeping_until = None
 
         # Most error messages will be specific to individual sites. Add those in each derived class
         self._error_strings = {'1020 Error': 'used Cloudflare to restrict access'}
 
+        # PageState kind of each error that isn't a plain (retryable) PageState.ERROR
+        self._error_kinds = {'1020 Error': PageState.BLOCKED}
+
+        # Built from the above on first use, once derived classes have added their errors
+        self._page_classifier = None
+
     def _spawn_driver_with_proxy(self):
         proxy = TorProxy()
         proxy.start()
-        proxy_driver = webdriver.Chrome(desired_capabilities=proxy.capabilities)
+        proxy_driver = webdriver.Chrome(desired_capabilities=proxy.capabilities,
+                                        options=self.launch_profile.chrome_options())
+        self.launch_profile.apply(proxy_driver)
 
         proxy_ip = check_ip(proxy_driver)
 
@@ -69,50 +144,120 @@ class Scraper(object):
 
     def load_session_cookies(self, file_path):
         if path.isfile(file_path):
-            for cookie in pickle.load(open(file_path, 'rb')):
-                for key, value in cookie.items():
-                    value = str(value)
-                    try:
-                        self._driver.add_cookie({'name': key, 'value': value})
-                    except InvalidArgumentException as e:
-                        raise ScraperException('Failed to add cookie key \'{}\' to session. Error: {}'.format(key, e))
-            self.logger.debug('Session cookies loaded from: {}'.format(file_path))
+            with open(file_path, 'rb') as f:
+                cookies = pickle.load(f)
+
+            # WebDriver only sets cookies for the domain of the page currently loaded
+            if urlparse(self._driver.current_url).hostname != urlparse(self.root).hostname:
+                self._load_page(self.root)
+
+            loaded = 0
+            for cookie in cookies:
+                cookie = {key: value for key, value in cookie.items() if key in COOKIE_KEYS}
+                if 'expiry' in cookie:
+                    cookie['expiry'] = int(cookie['expiry'])
+                try:
+                    self._driver.add_cookie(cookie)
+                    loaded += 1
+                except InvalidCookieDomainException:
+                    self.logger.debug('Skipped cookie \'{}\' for another domain: {}', cookie.get('name'),
+                                      cookie.get('domain'))
+                except InvalidArgumentException as e:
+                    raise ScraperException('Failed to add cookie \'{}\' to session. Error: {}'.format(
+                        cookie.get('name'), e))
+            self.logger.debug('{} session cookies loaded from: {}', loaded, file_path)
         else:
             self.logger.debug('No cookies found at: {}'.format(file_path))
 
     def _load_page(self, url, retry=3):
+        with self.timer.time('load_page'):
+            self._load_page_with_retries(url, retry)
+
+    def _load_page_with_retries(self, url, retry):
         success = False
         retry_wait_range = (0, 10)
         while success is False and retry > 0:
             try:
                 self._driver.get(url)
-                for error, message in self._error_strings.items():
-                    if message in self._driver.page_source:
-                        self.logger.error('{} detected.'.format(error))
-
-                        # Cloudflare or site bot detection; reload driver/proxy and try again
-                        if error in ('1020 Error', 'Bot Check') and self._use_proxy:
-                            self.logger.debug('Spawning fresh driver with proxy')
-                            self._driver = self._spawn_driver_with_proxy()
-                            break
-
-                        # Any other error type, wait a bit and try without reloading driver
-                        else:
-                            self.random_sleep(retry_wait_range)
-                else:
-                    success = True
+                page = self._classify_page()
+                if not page.ok:
+                    self.logger.error('{} detected.'.format(page.error))
+
+                    # Cloudflare or site bot detection; reload driver/proxy and try again
+                    if page.kind == PageState.BLOCKED and self._use_proxy:
+                        self.logger.debug('Spawning fresh driver with proxy')
+                        self._driver = self._spawn_driver_with_proxy()
+                        continue
+
+                    # Any other error type, wait a bit and try without reloading driver
+                    self.random_sleep(retry_wait_range)
+                success = True
             except WebDriverException as e:
                 retry -= 1
                 self.logger.error('{}. Retries left: {}'.format(e, retry))
         if success is False:
             raise ScraperException('Page failed to load; retry limit reached.')
 
-    def find(self, first, last, city, state):
+    def _wait_for(self, condition, timeout=None, poll_interval=None):
+        """
+        Block until condition() returns something truthy, re-checking every poll_interval seconds.
+        NoSuchElementException raised by condition() counts as not ready yet.
+        :param timeout: seconds; None waits indefinitely
+        :param poll_interval: seconds; defaults to the 'poll_interval' wait setting
+        :return: the truthy value, or None if timed out
+        """
+        if poll_interval is None:
+            poll_interval = self._waits['poll_interval']
+        wait = WebDriverWait(self._driver, timeout=float('inf') if timeout is None else max(timeout, 0),
+                             poll_frequency=poll_interval, ignored_exceptions=(NoSuchElementException,))
+        try:
+            return wait.until(lambda driver: condition())
+        except TimeoutException:
+            return None
+
+    @staticmethod
+    def _clickable(element):
+        """ :return: the element if it is displayed and enabled, otherwise None """
+        if element.is_displayed() and element.is_enabled():
+            return element
+        return None
+
+    def _classify_page(self):
+        """ :return: PageState of the current page, from a single page_source fetch """
+        if self._page_classifier is None:
+            self._page_classifier = PageClassifier(self._error_strings, self._error_kinds)
+        return self._page_classifier.classify(self._driver.page_source)
+
+    def _seconds_until_time_limit(self):
+        """ :return: seconds left before the run's time limit, or None if there is no limit """
+        if self._time_limit is None:
+            return None
+        return (self._time_limit - datetime.now()).total_seconds()
+
+    def find(self, first, last, city, state, report_urls=False):
+        """
+        :param report_urls: return the matches' report URLs rather than their WebElements
+        """
         raise NotImplementedError('Implement me in derived class, sucka')
 
     def get_info(self, search_result):
+        """
+        :param search_result: WebElement from find(), or a report URL from find(report_urls=True)
+        """
         raise NotImplementedError('Implement me in derived class, punk')
 
+    def _open_report_url(self, report_url):
+        with self.timer.time('load_page'):
+            self._driver.get(report_url)
+
+    def _timed_find(self, first, last, city, state):
+        with self.timer.time('find'):
+            return self.find(first=first, last=last, city=city, state=state, report_urls=self._direct_reports)
+
+    def _timed_get_info(self, search_result):
+        with self.timer.time('get_info'):
+            return self.get_info(search_result=search_result)
+
     def get_all_info(self, first, last, city, state):
         """
         Wrapper for find() and get_info() if all results are desirable. De-duping built-in.
@@ -121,22 +266,24 @@ class Scraper(object):
         full_info = {'phone_numbers': set(), 'email_addresses': set()}
         scrape_index = 0
 
-        search_results = self.find(first=first, last=last, city=city, state=state)
+        search_results = self._timed_find(first=first, last=last, city=city, state=state)
         self.logger.debug('{} matching results found.'.format(len(search_results)))
 
-        # NOTE: New elements are generated each time the search page is loaded, rendering all previous elements stale
+        # NOTE: New elements are generated each time the search page is loaded, rendering all previous elements stale.
+        # Report URLs don't go stale, so with direct_reports the search page is only loaded once.
         while scrape_index < len(search_results) and \
                 len(full_info['phone_numbers']) < self._limit_info_grabs and \
                 len(full_info['email_addresses']) < self._limit_info_grabs:
 
             # Opens Report and generates info dict
-            single_info = self.get_info(search_result=search_results[scrape_index])
+            single_info = self._timed_get_info(search_result=search_results[scrape_index])
 
             if type(single_info) == str and single_info in self._error_strings.keys():
 
-                # Error page encountered; reload the search results page and try once more
-                search_results = self.find(first=first, last=last, city=city, state=state)
-                single_info = self.get_info(search_result=search_results[scrape_index])
+                # Error page encountered; reload the search results page (if elements are stale) and try once more
+                if not self._direct_reports:
+                    search_results = self._timed_find(first=first, last=last, city=city, state=state)
+                single_info = self._timed_get_info(search_result=search_results[scrape_index])
 
             for number, number_type in single_info['phone_numbers'].items():
                 full_info['phone_numbers'].add(number)
@@ -151,7 +298,8 @@ class Scraper(object):
                 self.random_sleep(self._wait_range)
 
             # Navigate back to search results page (and reload elements)
-            search_results = self.find(first=first, last=last, city=city, state=state)
+            if not self._direct_reports:
+                search_results = self._timed_find(first=first, last=last, city=city, state=state)
 
             scrape_index += 1
 
@@ -168,13 +316,28 @@ class Scraper(object):
         return full_info
 
     def close(self):
+        # Leave a kept-alive Chrome running for the next run; only stop this run's chromedriver
+        if self._session_port is not None:
+            self._driver.service.stop()
+            self.logger.info('Chrome left running on port {} at {}'.format(self._session_port, datetime.now()))
+            return
+
         self._driver.close()
         self.logger.info('Chrome killed at {}'.format(datetime.now()))
 
-    def random_sleep(self, range_tuple):
+    def random_sleep(self, range_tuple, interrupt=None):
+        """
+        :param interrupt: optional threading.Event that cuts the wait short when set
+        """
         wait_time = random.uniform(*range_tuple)
-        self.logger.debug('Waiting for {} seconds...'.format(round(wait_time, 2)))
-        time.sleep(wait_time)
+        self.logger.debug('Waiting for {} seconds...', round(wait_time, 2))
+        self.sleeping_until = datetime.now() + timedelta(seconds=wait_time)
+        with self.timer.time('random_sleep'):
+            if interrupt is None:
+                time.sleep(wait_time)
+            else:
+                interrupt.wait(wait_time)
+        self.sleeping_until = None
 
     def save_screenshot(self):
         """
@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+# Longest stop() waits for a worker to finish the search it is in the middle of
+JOIN_TIMEOUT_SECONDS = 120
+
+
+class ScraperPool(object):
+
+    """
+    Runs one worker thread per Scraper (each driving its own browser), all pulling unique searches from a shared queue.
+    Each worker keeps the configured waits between its own searches.
+    A single writer collects results in input order with get().
+    """
+
+    def __init__(self, scrapers, searches, wait_range_between_rows, wait_range_between_report_loads, logger,
+                 time_limit=None):
+        self.logger = logger
+        self._scrapers = scrapers
+        self._wait_range_between_rows = wait_range_between_rows
+        self._wait_range_between_report_loads = wait_range_between_report_loads
+        self._time_limit = time_limit
+
+        # Searches are queued in the order the writer will need them
+        self._queue = queue.Queue()
+        for search_key in searches:
+            self._queue.put(search_key)
+
+        self._results = dict()
+        self._errors = list()
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._active_workers = 0
+
+        self._threads = [threading.Thread(target=self._work, args=(scraper,), name='scraper-{}'.format(index),
+                                          daemon=True)
+                         for index, scraper in enumerate(scrapers)]
+
+    @property
+    def reports_loaded(self):
+        return sum(scraper.reports_loaded for scraper in self._scrapers)
+
+    def start(self):
+        search_count = self._queue.qsize()
+        self._active_workers = len(self._threads)
+        for thread in self._threads:
+            thread.start()
+        self.logger.info('Started {} scraper workers for {} searches', len(self._threads), search_count)
+
+    def _work(self, scraper):
+        found_results = None
+        try:
+            while not self._stop_event.is_set():
+                if self._time_limit is not None and datetime.now() >= self._time_limit:
+                    break
+
+                try:
+                    search_key = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                # Randomized wait in between this worker's searches; shorter if the last one found nothing
+                if found_results is not None:
+                    if found_results:
+                        scraper.random_sleep(self._wait_range_between_rows, interrupt=self._stop_event)
+                    else:
+                        scraper.random_sleep(self._wait_range_between_report_loads, interrupt=self._stop_event)
+                    if self._stop_event.is_set():
+                        break
+
+                first_name, last_name, city, state = search_key
+                self.logger.debug('Search: {} {}, {} {}', first_name, last_name, city, state)
+                contact_info = scraper.get_all_info(first=first_name, last=last_name, city=city, state=state)
+                found_results = len(contact_info['phone_numbers']) > 0 or len(contact_info['email_addresses']) > 0
+
+                with self._condition:
+                    self._results[search_key] = contact_info
+                    self._condition.notify_all()
+
+        # ScraperException derives from BaseException; hand everything to the writer to re-raise
+        except BaseException as e:
+            with self._condition:
+                self._errors.append(e)
+                self._condition.notify_all()
+
+        finally:
+            with self._condition:
+                self._active_workers -= 1
+                self._condition.notify_all()
+
+    def get(self, search_key):
+        """
+        Block until a worker has scraped search_key. Re-raises the first worker error, if any.
+        :return: contact info dict, or None if the workers stopped (e.g. time limit) before reaching it
+        """
+        with self._condition:
+            while search_key not in self._results:
+                if len(self._errors) > 0:
+                    raise self._errors[0]
+                if self._active_workers == 0:
+                    return None
+                self._condition.wait()
+            return self._results.pop(search_key)
+
+    def stop(self, timeout=JOIN_TIMEOUT_SECONDS):
+        """ Ask workers to finish their current search and exit, and wait for them to do so """
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                self.logger.warning('Scraper worker {} is still running after {} seconds.', thread.name, timeout)
+
+    def unclaimed_results(self):
+        """
+        Searches the workers finished that the writer never got to (e.g. the run hit a limit first); call after stop().
+        :return: dict of search key -> contact info
+        """
+        with self._condition:
+            results = self._results
+            self._results = dict()
+        return results
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+import time
+from os import makedirs, path
+
+
+class SearchCache(object):
+
+    """
+    On-disk (SQLite) cache of scraped contact info, keyed by site and normalized search parameters.
+    Repeat owners across rows, sheets and runs reuse the stored result instead of loading any reports.
+    """
+
+    def __init__(self, db_path, ttl_days=None):
+        self.db_path = path.expanduser(db_path)
+        makedirs(path.dirname(self.db_path), exist_ok=True)
+
+        # Entries older than this are ignored and re-scraped; None never expires
+        self._ttl_seconds = None if ttl_days is None else ttl_days * 24 * 60 * 60
+
+        self._connection = sqlite3.connect(self.db_path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS search_results ('
+                                 'site TEXT NOT NULL, '
+                                 'first_name TEXT NOT NULL, '
+                                 'last_name TEXT NOT NULL, '
+                                 'city TEXT NOT NULL, '
+                                 'state TEXT NOT NULL, '
+                                 'contact_info TEXT NOT NULL, '
+                                 'scraped_at REAL NOT NULL, '
+                                 'PRIMARY KEY (site, first_name, last_name, city, state))')
+        self._connection.commit()
+
+        # Internal metrics
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_search(first, last, city, state):
+        return tuple(value.strip().upper() for value in (first, last, city, state))
+
+    def _lookup(self, site, first, last, city, state):
+        """ :return: stored contact JSON, or None if missing or expired """
+        cursor = self._connection.execute('SELECT contact_info, scraped_at FROM search_results '
+                                          'WHERE site = ? AND first_name = ? AND last_name = ? '
+                                          'AND city = ? AND state = ?',
+                                          (site,) + self.normalize_search(first, last, city, state))
+        entry = cursor.fetchone()
+
+        if entry is None or (self._ttl_seconds is not None and time.time() - entry[1] > self._ttl_seconds):
+            return None
+        return entry[0]
+
+    def get(self, site, first, last, city, state):
+        """
+        :return: contact info dict as returned by Scraper.get_all_info, or None if missing or expired
+        """
+        contact_json = self._lookup(site, first, last, city, state)
+
+        if contact_json is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        contact_info = json.loads(contact_json)
+        return {'phone_numbers': set(contact_info['phone_numbers']),
+                'email_addresses': set(contact_info['email_addresses'])}
+
+    def put(self, site, first, last, city, state, contact_info):
+        contact_json = json.dumps({'phone_numbers': sorted(contact_info['phone_numbers']),
+                                   'email_addresses': sorted(contact_info['email_addresses'])})
+        self._connection.execute('INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 (site,) + self.normalize_search(first, last, city, state) +
+                                 (contact_json, time.time()))
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
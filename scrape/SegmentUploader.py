@@ -0,0 +1,90 @@
+import csv
+import io
+import threading
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from lib.util import create_s3_object_key, get_s3_client
+
+
+class SegmentUploader(object):
+
+    """
+    Pushes the rows committed to a run's journal to S3 while the run is going, from a background thread, so an
+    instance that dies mid-run has still delivered everything up to its last upload.
+
+    Every interval, the rows journaled since the last upload become one CSV segment (with header), keyed after the
+    output file with its row range appended: '<output>.<hostname>.rows000001-000250.csv'. The final output is still
+    uploaded whole at the end of the run. A resumed run re-uploads from its first row, so overlapping segments of
+    one output always hold the same rows.
+    """
+
+    def __init__(self, journal, out_file, hostname, bucket, interval_seconds, logger, endpoint_url=None):
+        self._journal = journal
+        self._out_file = out_file
+        self._hostname = hostname
+        self._bucket = bucket
+        self._interval_seconds = interval_seconds
+        self.logger = logger
+        self._client = get_s3_client(endpoint_url)
+
+        self._offset = 0
+        self._fieldnames = None
+        self.rows_uploaded = 0
+        self.segments_uploaded = 0
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='segment-uploader', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval_seconds):
+            self.push()
+
+    def push(self):
+        """ Upload the rows journaled since the last upload, if any. Failures are retried on the next push. """
+        rows = list()
+        offset = self._offset
+        header_pending = offset == 0
+        for end_offset, entry in self._journal.read_lines(offset):
+            if header_pending:
+                self._fieldnames = entry['fieldnames']
+                header_pending = False
+            # Revisions of earlier rows (reclaimed coordinator batches) only reach S3 with the final output
+            elif isinstance(entry, dict):
+                rows.append(entry)
+            offset = end_offset
+
+        if len(rows) == 0:
+            self._offset = offset
+            return
+
+        body = io.StringIO()
+        writer = csv.DictWriter(body, fieldnames=self._fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+        first_row = self.rows_uploaded + 1
+        last_row = self.rows_uploaded + len(rows)
+        object_name = create_s3_object_key(local_file_path=self._out_file, hostname=self._hostname,
+                                           segment='rows{:06d}-{:06d}'.format(first_row, last_row))
+        try:
+            self._client.put_object(Bucket=self._bucket, Key=object_name, Body=body.getvalue().encode('utf-8'))
+        except (BotoCoreError, ClientError) as e:
+            self.logger.warning('Segment upload of rows {}-{} failed; retrying next time. {}'.format(first_row,
+                                                                                                     last_row, e))
+            return
+
+        self._offset = offset
+        self.rows_uploaded = last_row
+        self.segments_uploaded += 1
+        self.logger.debug('Uploaded rows {}-{} to {}/{}', first_row, last_row, self._bucket, object_name)
+
+    def stop(self):
+        """ Stop the thread, then push whatever was journaled since its last upload """
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.push()
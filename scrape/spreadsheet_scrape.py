@@ -1,28 +1,41 @@
 import sys
 import traceback
 from argparse import ArgumentParser
-from copy import deepcopy
-from csv import DictReader, DictWriter
+from array import array
+from csv import DictReader
 from datetime import datetime, timedelta
+from itertools import islice
 from os import path, getpid
 from re import compile
 from socket import gethostname
-from time import sleep
+from time import perf_counter, sleep
 
 from botocore.exceptions import ClientError
 from selenium.common.exceptions import NoSuchWindowException, WebDriverException
 
 from SheetConfig import SheetConfig
+from lib.AtomicCsvWriter import AtomicCsvWriter
 from lib.CacheLogger import CacheLogger
-from lib.exceptions import ScraperException, SheetConfigException
+from lib.PhaseTimer import PhaseTimer
+from lib.exceptions import RowJournalException, ScraperException, SheetConfigException
 from lib.util import create_new_filename, upload_file, get_current_ec2_instance_id, shutdown_ec2_instance, \
     get_current_ec2_instance_region, create_logger, create_s3_object_key
 # from scrape.BVScraper import BVScraper
+from scrape.BrowserSessions import BrowserSessions
 from scrape.Caffeine import Caffeine
+from scrape.CoordinatorClient import CoordinatorClient
 from scrape.EmailReporter import EmailReporter, EmailReporterException
 from scrape.FpsScraper import FpsScraper
 from scrape.ICScraper import ICScraper
+from scrape.LaunchProfile import LaunchProfile
+from scrape.MetricsServer import MetricsServer
+from scrape.OwnerKeyTable import OwnerKeyTable
+from scrape.RowJournal import RowJournal
 from scrape.RunConfig import RunConfig
+from scrape.Scraper import DOM_EXTRACTION_MODES
+from scrape.ScraperPool import ScraperPool
+from scrape.SearchCache import SearchCache
+from scrape.SegmentUploader import SegmentUploader
 
 
 SUPPORTED_SITES = {'fps', 'ic'}
@@ -30,6 +43,9 @@ SUPPORTED_SITES = {'fps', 'ic'}
 # Print separator
 SEP = '-' * 60
 
+# Seconds between checks on batches still leased to other workers, once this host has nothing left to lease
+RECLAIM_POLL_SECONDS = 60
+
 
 def validate_sheet_config_dict(config_dict):
     """
@@ -104,6 +120,63 @@ def get_columns(dict_reader, config_dict):
     return return_dict
 
 
+def get_output_columns(dict_reader, column_dict):
+    """
+    Extend the input sheet's columns with a phone and email column per owner column group, plus 'scraped'
+    :param dict_reader: a csv.DictReader object; its fieldnames are extended in place
+    :param column_dict: dict as returned by get_columns()
+    :return: tuple of (output column list, {'phone': [column per group], 'email': [column per group]})
+    """
+    contact_columns = {'phone': list(), 'email': list()}
+
+    # Output sheet will have at least the input sheet's columns
+    output_columns = dict_reader.fieldnames
+
+    # Build initial output column list
+    column_index = 0
+    while column_index < column_dict['count']:
+
+        column_prefix = path.commonprefix([column_dict['first_names'][column_index],
+                                           column_dict['last_names'][column_index]])
+        phone_column = '{} Phone'.format(column_prefix)
+        email_column = '{} Email'.format(column_prefix)
+
+        contact_columns['phone'].append(phone_column)
+        contact_columns['email'].append(email_column)
+
+        # Add contact columns to header as needed
+        for contact_column in (phone_column, email_column):
+            if contact_column not in output_columns:
+                output_columns.append(contact_column)
+
+        column_index += 1
+
+    # 'scraped' column is a flag that simply confirms that a given row was previously auto-scraped
+    if 'scraped' not in output_columns:
+        output_columns.append('scraped')
+
+    return output_columns, contact_columns
+
+
+def extract_owner_keys(in_file, column_dict, hostname, skip_rows=0):
+    """
+    Pre-pass over the input sheet that normalizes every owner search of the rows this host still has to scrape,
+    across all owner column groups, and counts how many times each unique one is referenced. No sorting required.
+    :param hostname: Only include rows assigned to this host; None includes every row (coordinator mode)
+    :param skip_rows: Number of leading rows already completed by a resumed run
+    :return: OwnerKeyTable, whose row positions start after skip_rows
+    """
+    def include_row(row):
+        if 'scraped' in row.keys() and row_should_be_skipped(row_scraped_value=row['scraped']):
+            return False
+        if hostname is not None and 'hostname' in row.keys() and row['hostname'] != hostname:
+            return False
+        return True
+
+    with open(in_file, 'r') as f:
+        return OwnerKeyTable(column_dict).load(islice(DictReader(f), skip_rows, None), include_row)
+
+
 def row_should_be_skipped(row_scraped_value):
     """
     :param row_scraped_value: Value read from 'scraped' column
@@ -122,15 +195,132 @@ def row_should_be_skipped(row_scraped_value):
         return False
 
 
+def lease_remaining_batches(coordinator, time_limit):
+    """
+    Lease every batch left in the coordinator's queue, from the start of the sheet. Called once this host has been
+    through the whole sheet, so these are batches that expired (or were released) behind it. While the only
+    batches left are leased to other workers, waits for them to finish or expire.
+    :return: list of batch leases in row order; empty once every batch is completed, or at the time limit
+    """
+    while True:
+        batch_leases = list()
+
+        # The coordinator hands a worker its own unfinished batches first, so lease past each one to get the next
+        batch_lease = coordinator.lease(min_row=1)
+        while batch_lease is not None:
+            batch_leases.append(batch_lease)
+            batch_lease = coordinator.lease(min_row=batch_lease['end_row'] + 1)
+        if len(batch_leases) > 0:
+            logger.info('Reclaimed rows {}'.format(', '.join('{}-{}'.format(lease['start_row'], lease['end_row'])
+                                                             for lease in batch_leases)))
+            return batch_leases
+
+        queue_status = coordinator.status()
+        if queue_status['completed_batches'] >= queue_status['total_batches']:
+            return batch_leases
+        if time_limit is not None and datetime.now() >= time_limit:
+            logger.info('Minute limit reached while waiting on other workers.')
+            return batch_leases
+        logger.info('Waiting on {} batches leased to other workers...'.format(queue_status['leased_batches']))
+        sleep(RECLAIM_POLL_SECONDS)
+
+
+def reclaim_batches(batch_leases, out_file, output_columns, scrape_row, journal, coordinator, run_timer,
+                    reached_limit):
+    """
+    Scrape the rows of reclaimed batches into a fresh copy of out_file, in a single pass over it however many batches
+    there are. Reclaimed rows are journaled as revisions, so a resumed run keeps them.
+    :param batch_leases: leases in row order, as returned by lease_remaining_batches()
+    :param scrape_row: function(owner key position, row) -> completed output row, or None if the run has to stop
+    :param reached_limit: function() -> True once the run's row or minute limit is reached
+    :return: tuple of (True if the run stopped at a limit, number of batches completed)
+    """
+    # Rows done so far in each batch; None once its lease is lost to another worker
+    done_through = [batch_lease['start_row'] - 1 for batch_lease in batch_leases]
+    batch_index = 0
+    stopped = False
+
+    with open(out_file, 'r', newline='') as previous_output, \
+            AtomicCsvWriter(out_file, fieldnames=output_columns) as sheet_writer:
+        for row_number, row in enumerate(DictReader(previous_output), start=1):
+            while batch_index < len(batch_leases) and row_number > batch_leases[batch_index]['end_row']:
+                batch_index += 1
+
+            if stopped or batch_index == len(batch_leases) or row_number < batch_leases[batch_index]['start_row'] \
+                    or done_through[batch_index] is None:
+                sheet_writer.writerow(row)
+                continue
+
+            if 'scraped' in row.keys() and row_should_be_skipped(row_scraped_value=row['scraped']):
+                sheet_writer.writerow(row)
+                done_through[batch_index] = row_number
+                continue
+
+            # Row positions in the owner key table are absolute with a coordinator
+            row_start = perf_counter()
+            output_row = scrape_row(row_number - 1, row)
+            if output_row is None:
+                logger.info('Scraper workers stopped; ending run at row {}.'.format(row_number))
+                stopped = True
+                sheet_writer.writerow(row)
+                continue
+
+            run_timer.record('row', perf_counter() - row_start)
+            with run_timer.time('csv_write'):
+                sheet_writer.writerow(output_row)
+                journal.record_revision(row_number, output_row)
+            done_through[batch_index] = row_number
+
+            # Heartbeat every batch held; all of them are only completed once the new out_file is in place
+            for index, batch_lease in enumerate(batch_leases):
+                if done_through[index] is not None and not coordinator.renew(batch_lease['batch_id']):
+                    logger.warning('Lease on rows {}-{} was lost to another worker.'.format(batch_lease['start_row'],
+                                                                                          batch_lease['end_row']))
+                    done_through[index] = None
+
+            stopped = reached_limit()
+
+    # Finish the batches, and hand unfinished ones straight back instead of waiting for them to expire
+    batches_completed = 0
+    for batch_lease, rows_done in zip(batch_leases, done_through):
+        if rows_done is None:
+            continue
+        if rows_done >= batch_lease['end_row']:
+            coordinator.complete(batch_lease['batch_id'])
+            batches_completed += 1
+        else:
+            coordinator.release(batch_lease['batch_id'])
+
+    return stopped, batches_completed
+
+
 def main(config_path, site, environment, limit_rows=None, limit_minutes=None, limit_info_grabs=20,
-         auto_close=False, email_report=False):
+         auto_close=False, email_report=False, use_search_cache=True, resume=False, browsers=1,
+         coordinator_url=None, metrics_port=None, dom_extraction='page_source', direct_reports=True, headless=False,
+         keep_browser=False, sync_minutes=None):
     scraper = None
+    scrapers = list()
+    scraper_pool = None
+    search_cache = None
+    journal = None
+    segment_uploader = None
+    metrics_server = None
+    coordinator = None
+    batch_lease = None
+    resumed_rows = 0
     time_limit = None
     screenshot_path = None
 
+    # Per-phase timings for work done outside the scrapers; each scraper keeps its own
+    run_timer = PhaseTimer()
+
     metrics = {'row_count': 0,
                'scraped_count': 0,
                'failed_count': 0,
+               'searches_saved': 0,
+               'resumed_rows': 0,
+               'batches_completed': 0,
+               'segments_uploaded': 0,
                'end_time': None}
 
     # Site string mapping to associated classes
@@ -144,6 +334,12 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
 
     hostname = gethostname()
 
+    # Rows are leased from a central coordinator instead of being assigned by the sheet's 'hostname' column
+    if coordinator_url is not None and browsers > 1:
+        logger.error('--coordinator can not be combined with --browsers; '
+                     'run one browser per host for a coordinated sheet. Exiting.')
+        sys.exit(1)
+
     # Path to the chromedriver executable; as downloaded by the install_chrome script
     chromedriver_path = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'lib', 'chromedriver')
 
@@ -151,6 +347,16 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
     cookie_file = path.join(path.dirname(path.dirname(path.abspath(__file__))),
                             'data', '.{}_cookie_jar.pkl'.format(site))
 
+    # One Chrome profile per browser, so concurrent browsers don't fight over session state
+    profile_root = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data', '.chrome_profiles')
+
+    # DevTools ports of the browsers kept running between runs with --keep-browser
+    browser_sessions_file = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                                      'data', '.browser_sessions.json')
+
+    # Scraped results are remembered across rows, sheets and runs
+    search_cache_file = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data', '.search_cache.sqlite')
+
     # Don't let the computer go to sleep, else it will kill the scraper
     pid = getpid()
     try:
@@ -175,6 +381,39 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
 
         # Output Sheet
         out_file = create_new_filename(in_path=in_file, overwrite_existing=True)
+        output_columns, contact_columns = get_output_columns(sheet_reader, column_dict)
+
+        # Checkpoint journal of completed rows; named after the input so a resume can happen on any later day
+        journal = RowJournal(journal_path='{}.journal'.format(path.splitext(in_file)[0]))
+        journal.lock()
+        if resume:
+            if journal.exists():
+                resumed_rows = journal.load(output_columns)
+                metrics['resumed_rows'] = resumed_rows
+                logger.info('Resuming after {} committed rows from: {}'.format(resumed_rows, journal.path))
+            else:
+                logger.warning('No journal found at {}; starting from the first row.'.format(journal.path))
+
+        # Each run is its own worker, named per process; a resumed run takes its predecessor's name (stored beside the
+        # journal) so it gets its unfinished batch back
+        if coordinator_url is not None:
+            worker = journal.worker_id('{}-{}'.format(hostname, getpid()), reuse=resume)
+            coordinator = CoordinatorClient(url=coordinator_url, worker=worker)
+            logger.info('Leasing rows from coordinator: {} as {}'.format(coordinator_url, worker))
+
+        # Every unique owner is scraped once, then fanned back out to every row that references it.
+        # Leases aren't known up front with a coordinator, so every pending row is counted.
+        # Rows already journaled are kept in that case too, in case a batch among them is reclaimed later.
+        owner_key_offset = 0 if coordinator is not None else resumed_rows
+        owner_keys = extract_owner_keys(in_file, column_dict, hostname=None if coordinator is not None else hostname,
+                                        skip_rows=owner_key_offset)
+        logger.info('Owner searches: {} unique of {} referenced'.format(len(owner_keys.keys),
+                                                                       owner_keys.reference_count()))
+
+        # Search Cache
+        if use_search_cache:
+            search_cache = SearchCache(db_path=search_cache_file, ttl_days=run_config.search_cache_ttl_days)
+            logger.info('Search cache:   {}'.format(search_cache.db_path))
 
     except SheetConfigException as e:
         logger.exception('Failed to load sheet config \'{}\'. Error: {}'.format(config_path, e))
@@ -184,9 +423,58 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
         logger.exception('Failed to load run config \'{}\'. Error: {}'.format(RunConfig.CONFIG_PATH, e))
         sys.exit(1)
 
+    except RowJournalException as e:
+        logger.exception('Failed to open journal. Error: {}'.format(e))
+        sys.exit(1)
+
     start_time = datetime.now()
     logger.info('Beginning scrape')
 
+    def collect_live_metrics():
+        """ Snapshot of the run so far; called from the metrics server thread, so it only reads """
+        now = datetime.now()
+        elapsed_hours = (now - start_time).total_seconds() / 60 / 60
+        reports_loaded = sum(open_scraper.reports_loaded for open_scraper in list(scrapers))
+        attempted_rows = metrics['scraped_count'] + metrics['failed_count']
+
+        sleep_seconds_left = list()
+        for open_scraper in list(scrapers):
+            sleeping_until = open_scraper.sleeping_until
+            if sleeping_until is not None:
+                sleep_seconds_left.append(max(0.0, (sleeping_until - now).total_seconds()))
+
+        return [
+            ('scrape_rows_processed_total', 'counter', 'Input rows processed, including passed-through rows',
+             metrics['row_count']),
+            ('scrape_rows_scraped_total', 'counter', 'Rows with contact info found', metrics['scraped_count']),
+            ('scrape_rows_failed_total', 'counter', 'Rows searched without finding contact info',
+             metrics['failed_count']),
+            ('scrape_reports_loaded_total', 'counter', 'Reports loaded', reports_loaded),
+            ('scrape_rows_per_hour', 'gauge', 'Rows processed per hour this run',
+             round((metrics['row_count'] - metrics['resumed_rows']) / elapsed_hours, 2) if elapsed_hours > 0 else 0),
+            ('scrape_reports_per_hour', 'gauge', 'Reports loaded per hour this run',
+             round(reports_loaded / elapsed_hours, 2) if elapsed_hours > 0 else 0),
+            ('scrape_failure_rate', 'gauge', 'Fraction of searched rows without contact info',
+             round(metrics['failed_count'] / attempted_rows, 4) if attempted_rows > 0 else 0),
+            ('scrape_browsers_sleeping', 'gauge', 'Browsers currently in a randomized wait', len(sleep_seconds_left)),
+            ('scrape_sleep_seconds_remaining', 'gauge', 'Longest remaining randomized wait',
+             round(max(sleep_seconds_left), 2) if sleep_seconds_left else 0),
+            ('scrape_time_limit_seconds_remaining', 'gauge', 'Seconds left until the --limit-minutes deadline',
+             round(max(0.0, (time_limit - now).total_seconds()), 2) if time_limit is not None else None),
+            ('scrape_uptime_seconds', 'gauge', 'Seconds since the scrape began',
+             round((now - start_time).total_seconds(), 2)),
+        ]
+
+    # Live metrics for long runs, served on a background thread so the scrape loop never waits on it
+    if metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(collect=collect_live_metrics, port=metrics_port)
+            metrics_server.start()
+            logger.info('Serving live metrics at http://localhost:{}/metrics'.format(metrics_port))
+        except OSError as e:
+            logger.error('Unable to serve metrics on port {}: {}'.format(metrics_port, e))
+            metrics_server = None
+
     # DO THE THING!
     try:
 
@@ -198,8 +486,8 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
         if limit_rows is not None:
             logger.info('Run limited to {} rows'.format(limit_rows))
 
-        # User prompt if out_file already exists; warn of overwrite!
-        if path.isfile(out_file):
+        # User prompt if out_file already exists; warn of overwrite! A resume rebuilds it from the journal.
+        if path.isfile(out_file) and not resume:
             logger.warning('Output file already exists: {}'.format(out_file))
             overwrite = input('Do you wish to overwrite existing file? '
                               'All previous scrapes in this file will be lost! '
@@ -211,129 +499,151 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
                 logger.info('Config: {}'.format(config_path))
                 sys.exit()
 
-        # Initialize scraper
-        scraper = scraper_mapping[site](logger=logger, wait_range=run_config.wait_range_between_report_loads,
-                                        chromedriver_path=chromedriver_path, time_limit=time_limit, use_proxy=False,
-                                        limit_info_grabs=limit_info_grabs)
-
-        # Login to the site (automatically, or await user input)
-        scraper.login(cookie_file)
-
-        with open(out_file, 'w') as out:
+        # Initialize scraper(s)
+        browser_settings = dict(run_config.browser or dict())
+        if headless:
+            browser_settings['headless'] = True
+        launch_profile = LaunchProfile(browser_settings)
+        browser_sessions = BrowserSessions(browser_sessions_file) if keep_browser else None
+
+        for browser_index in range(browsers):
+            profile_dir = None
+            session_port = None
+            if browsers > 1 or launch_profile.reuse_profile or keep_browser:
+                profile_dir = path.join(profile_root, '{}_{}'.format(site, browser_index))
+            if keep_browser:
+                session_port = browser_sessions.port('{}_{}'.format(site, browser_index))
+            with run_timer.time('browser_start'):
+                scraper = scraper_mapping[site](logger=logger,
+                                                wait_range=run_config.wait_range_between_report_loads,
+                                                chromedriver_path=chromedriver_path, time_limit=time_limit,
+                                                use_proxy=False, limit_info_grabs=limit_info_grabs,
+                                                profile_dir=profile_dir, dom_extraction=dom_extraction,
+                                                direct_reports=direct_reports, waits=run_config.waits,
+                                                launch_profile=launch_profile, session_port=session_port)
+
+            # Login to the site (automatically, or await user input)
+            with run_timer.time('login'):
+                scraper.login(cookie_file)
+            scrapers.append(scraper)
+
+        # The first browser stands in for the rest for screenshots
+        scraper = scrapers[0]
+
+        # Rows are buffered into a temp file that replaces out_file once the run ends, however it ends; a crash leaves
+        # no torn output behind, and --resume rebuilds it from the journal
+        with AtomicCsvWriter(out_file, fieldnames=output_columns, keep_partial=True) as sheet_writer:
             logger.info('Writing to:     {}'.format(out_file))
 
-            last_search = None
-            current_search = {'first_name': None, 'last_name': None, 'city': None, 'state': None}
-            contact_columns = {'phone': list(), 'email': list()}
-
-            # Output sheet will have at least the input sheet's columns
-            output_columns = sheet_reader.fieldnames
-
-            # Build initial output column list
-            column_index = 0
-            while column_index < column_dict['count']:
-
-                column_prefix = path.commonprefix([column_dict['first_names'][column_index],
-                                                   column_dict['last_names'][column_index]])
-                phone_column = '{} Phone'.format(column_prefix)
-                email_column = '{} Email'.format(column_prefix)
-
-                contact_columns['phone'].append(phone_column)
-                contact_columns['email'].append(email_column)
-
-                # Add contact columns to header as needed
-                for contact_column in (phone_column, email_column):
-                    if contact_column not in output_columns:
-                        output_columns.append(contact_column)
-
-                column_index += 1
-
-            # 'scraped' column is a flag that simply confirms that a given row was previously auto-scraped
-            if 'scraped' not in output_columns:
-                output_columns.append('scraped')
-
-            # Initialize output sheet with header
-            sheet_writer = DictWriter(out, fieldnames=output_columns)
-            sheet_writer.writeheader()
-
-            last_row = None
-            last_search_was_duplicate = False
-            last_row_was_duplicate = False
+            # Rows committed by an interrupted run are copied straight from the journal
+            for journaled_row in journal.replay():
+                sheet_writer.writerow(journaled_row)
+            journal.open(output_columns, append=resumed_rows > 0)
+            metrics['row_count'] = resumed_rows
+
+            # Ship journaled rows to S3 every few minutes, in case this instance dies before the final upload
+            if environment == 'ec2' and sync_minutes:
+                segment_uploader = SegmentUploader(journal=journal, out_file=out_file, hostname=hostname,
+                                                   bucket=run_config.upload_bucket,
+                                                   interval_seconds=sync_minutes * 60, logger=logger,
+                                                   endpoint_url=run_config.upload_endpoint_url)
+                segment_uploader.start()
+
+            def write_row(completed_row):
+                with run_timer.time('csv_write'):
+                    sheet_writer.writerow(completed_row)
+                    journal.record(completed_row)
+
+            # Contact info for owners already searched this run, by owner key code; released once no later row
+            # references them
+            owner_results = dict()
+            remaining_references = array('l', owner_keys.references)
+
+            # Rows that load reports are spaced out by a longer wait than searches within a row
+            row_wait_pending = False
             found_results = False
 
-            # Iterate through rows in the spreadsheet
-            for row in sheet_reader:
+            # Multiple browsers scrape every uncached unique owner ahead of the writer, in first-reference order.
+            # Cached results are read now, so an entry that expires before the writer reaches its row can't leave
+            # the writer waiting on a search that was never queued.
+            cached_results = dict()
+            if len(scrapers) > 1:
+                pending_searches = list()
+                for search_key in owner_keys.keys:
+                    contact_info = search_cache.get(site, *search_key) if search_cache is not None else None
+                    if contact_info is None:
+                        pending_searches.append(search_key)
+                    else:
+                        cached_results[search_key] = contact_info
+                scraper_pool = ScraperPool(scrapers=scrapers, searches=pending_searches,
+                                           wait_range_between_rows=run_config.wait_range_between_rows,
+                                           wait_range_between_report_loads=run_config.wait_range_between_report_loads,
+                                           logger=logger, time_limit=time_limit)
+                scraper_pool.start()
+            queue_drained = False
+            limit_reached = False
+
+            def scrape_row(key_position, row):
+                """
+                Search every owner column group of the row, reusing the results of owners already searched
+                :param key_position: the row's position in owner_keys
+                :return: the completed output row, or None if the scraper workers stopped before finishing it
+                """
+                nonlocal row_wait_pending, found_results
+
+                last_row_found_results = found_results
+                found_results = False
+                output_row = dict(row)
+                grouped_contact_dict = dict()
+                searched_site = False
+                workers_finished = False
 
-                metrics['row_count'] += 1
+                # Iterate through groups of columns
+                for index, owner_code in enumerate(owner_keys.row_codes(key_position)):
 
-                # Hacky crap
-                # TODO: something about this flag is causing the first row to always say "Skipping duplicate row"
-                if metrics['row_count'] == 1:
-                    duplicate_row = False
-                else:
-                    duplicate_row = True
+                    # Skip empty column groups
+                    if owner_code < 0:
+                        continue
 
-                # Skip already-scraped rows
-                if 'scraped' in row.keys() and row_should_be_skipped(row_scraped_value=row['scraped']):
-                    logger.debug('Skipping row {} with \'scraped\' value: \'{}\''.format(metrics['row_count'],
-                                                                                         row['scraped']))
-                    sheet_writer.writerow(row)
-                    continue
+                    search_key = owner_keys.keys[owner_code]
+                    first_name, last_name, city, state = search_key
 
-                if 'hostname' in row.keys() and row['hostname'] != hostname:
-                    logger.debug('Skipping row {} with hostname \'{}\''.format(metrics['row_count'],
-                                                                               row['hostname']))
-                    sheet_writer.writerow(row)
-                    continue
+                    if owner_code in owner_results:
+                        logger.debug('\t  Reusing results for {} {}, {} {}...', *search_key)
+                        contact_info = owner_results[owner_code]
+                        metrics['searches_saved'] += 1
 
-                # Randomized wait in between searches
-                if metrics['scraped_count'] > 0 and not last_search_was_duplicate and not last_row_was_duplicate:
-                    if found_results:
-                        scraper.random_sleep(run_config.wait_range_between_rows)
                     else:
-                        # A shorter wait time if 0 matching results were found for a row
-                        scraper.random_sleep(run_config.wait_range_between_report_loads)
+                        logger.debug('Search: {} {}, {} {}', *search_key)
 
-                found_results = False
-                output_row = deepcopy(row)
-                grouped_contact_dict = dict()
+                        # With a pool, the cache was already read for every owner when the searches were queued
+                        contact_info = cached_results.pop(search_key, None)
+                        if contact_info is None and search_cache is not None and scraper_pool is None:
+                            contact_info = search_cache.get(site, first_name, last_name, city, state)
 
-                # Iterate through groups of columns
-                index = 0
-                while index < column_dict['count']:
-                    first_name = row[column_dict['first_names'][index]].strip().upper()
-                    last_name = row[column_dict['last_names'][index]].strip().upper()
-                    city = row[column_dict['cities'][index]].strip().upper()
-                    state = row[column_dict['states'][index]].strip().upper()
-
-                    # Skip duplicate rows
-                    if last_row is not None:
-                        if first_name == last_row[column_dict['first_names'][index]].strip().upper() and \
-                                last_name == last_row[column_dict['last_names'][index]].strip().upper() and \
-                                city == last_row[column_dict['cities'][index]].strip().upper() and \
-                                state == last_row[column_dict['states'][index]].strip().upper():
-                            output_row[contact_columns['phone'][contact_index]] = \
-                                last_row[contact_columns['phone'][contact_index]]
-                            output_row[contact_columns['email'][contact_index]] = \
-                                last_row[contact_columns['email'][contact_index]]
-                            index += 1
-                            found_results = True
-                            continue
-                        else:
-                            duplicate_row = False
+                        if contact_info is not None:
+                            logger.debug('\t  Using cached search results...')
 
-                    grouped_contact_dict[index] = {'phone_numbers': list(), 'email_addresses': list()}
+                        elif scraper_pool is not None:
+                            contact_info = scraper_pool.get(search_key)
 
-                    # Skip empty column groups
-                    if first_name not in (None, '') and last_name not in (None, ''):
+                            # Workers hit the time limit before getting this far
+                            if contact_info is None:
+                                workers_finished = True
+                                break
 
-                        current_search['first_name'] = first_name
-                        current_search['last_name'] = last_name
-                        current_search['city'] = city
-                        current_search['state'] = state
+                            if search_cache is not None:
+                                search_cache.put(site, first_name, last_name, city, state, contact_info)
 
-                        if current_search != last_search:
-                            logger.debug('Search: {} {}, {} {}'.format(first_name, last_name, city, state))
+                        else:
+                            # Randomized wait in between rows
+                            if row_wait_pending:
+                                if last_row_found_results:
+                                    scraper.random_sleep(run_config.wait_range_between_rows)
+                                else:
+                                    # A shorter wait time if 0 matching results were found for a row
+                                    scraper.random_sleep(run_config.wait_range_between_report_loads)
+                                row_wait_pending = False
 
                             # Short wait in between all report loads
                             if metrics['scraped_count'] > 1:
@@ -342,26 +652,21 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
                             # Use the current search params to scrape contact info
                             contact_info = scraper.get_all_info(first=first_name, last=last_name, city=city,
                                                                 state=state)
+                            searched_site = True
 
-                            last_search = deepcopy(current_search)
-                            last_search_was_duplicate = False
+                            if search_cache is not None:
+                                search_cache.put(site, first_name, last_name, city, state, contact_info)
 
-                        else:
-                            logger.debug('\t  Skipping duplicate search...')
-                            last_search_was_duplicate = True
+                        owner_results[owner_code] = contact_info
 
-                            # Reuse the last scraped contact info
-                            contact_info = scraper.last_contact_info
+                    grouped_contact_dict[index] = contact_info
 
-                        grouped_contact_dict[index] = contact_info
+                    remaining_references[owner_code] -= 1
+                    if remaining_references[owner_code] <= 0:
+                        del owner_results[owner_code]
 
-                    index += 1
-
-                if duplicate_row:
-                    last_row_was_duplicate = True
-                    logger.debug('\t  Skipping duplicate row...')
-                else:
-                    last_row_was_duplicate = False
+                if workers_finished:
+                    return None
 
                 for contact_index, contact_info in grouped_contact_dict.items():
                     phone_numbers = list(contact_info['phone_numbers'])
@@ -385,18 +690,101 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
                     output_row['scraped'] = 'failed'
                     metrics['failed_count'] += 1
 
-                # Write out the completed row
-                sheet_writer.writerow(output_row)
+                # Only rows that actually hit the site need spacing from the next one
+                if searched_site:
+                    row_wait_pending = True
 
+                return output_row
+
+            def reached_limit():
+                """ :return: True, once logged, if the run's row or minute limit has been reached """
                 if limit_rows is not None and metrics['scraped_count'] >= limit_rows:
                     logger.info('Row limit ({}) reached!'.format(limit_rows))
-                    break
-
+                    return True
                 if time_limit is not None and datetime.now() >= time_limit:
                     logger.info('Minute limit ({}) reached!'.format(limit_minutes))
+                    return True
+                return False
+
+            # Iterate through rows in the spreadsheet
+            for row_position, row in enumerate(islice(sheet_reader, resumed_rows, None),
+                                               start=resumed_rows - owner_key_offset):
+
+                metrics['row_count'] += 1
+
+                # Every row of a leased batch has been written; lease the next one at or after this row
+                if coordinator is not None:
+                    if batch_lease is not None and metrics['row_count'] > batch_lease['end_row']:
+                        coordinator.complete(batch_lease['batch_id'])
+                        metrics['batches_completed'] += 1
+                        batch_lease = None
+                    if batch_lease is None and not queue_drained:
+                        batch_lease = coordinator.lease(min_row=metrics['row_count'])
+                        if batch_lease is None:
+                            queue_drained = True
+                            logger.info('No more batches to lease; passing the remaining rows through.')
+                        else:
+                            logger.info('Leased rows {}-{}'.format(batch_lease['start_row'],
+                                                                   batch_lease['end_row']))
+
+                # Skip already-scraped rows
+                if 'scraped' in row.keys() and row_should_be_skipped(row_scraped_value=row['scraped']):
+                    logger.debug('Skipping row {} with \'scraped\' value: \'{}\'', metrics['row_count'], row['scraped'])
+                    write_row(row)
+                    continue
+
+                if coordinator is not None:
+                    if batch_lease is None or metrics['row_count'] < batch_lease['start_row']:
+                        logger.debug('Skipping row {}; not leased to this host', metrics['row_count'])
+                        write_row(row)
+                        continue
+
+                elif 'hostname' in row.keys() and row['hostname'] != hostname:
+                    logger.debug('Skipping row {} with hostname \'{}\'', metrics['row_count'], row['hostname'])
+                    write_row(row)
+                    continue
+
+                row_start = perf_counter()
+                output_row = scrape_row(row_position, row)
+
+                # Leave the unfinished row out of the output, like any other limit
+                if output_row is None:
+                    logger.info('Scraper workers stopped; ending run at row {}.'.format(metrics['row_count']))
+                    limit_reached = True
                     break
 
-                last_row = output_row
+                # Write out the completed row
+                run_timer.record('row', perf_counter() - row_start)
+                write_row(output_row)
+
+                # Heartbeat; if the lease expired and went to another worker, leave it the rest of the batch
+                if coordinator is not None and not coordinator.renew(batch_lease['batch_id']):
+                    logger.warning('Lease on rows {}-{} was lost to another worker.'.format(batch_lease['start_row'],
+                                                                                          batch_lease['end_row']))
+                    batch_lease = None
+
+                if reached_limit():
+                    limit_reached = True
+                    break
+
+            # Finish the last batch, or hand an unfinished one straight back instead of waiting for it to expire
+            if batch_lease is not None:
+                if metrics['row_count'] >= batch_lease['end_row']:
+                    coordinator.complete(batch_lease['batch_id'])
+                    metrics['batches_completed'] += 1
+                else:
+                    coordinator.release(batch_lease['batch_id'])
+                batch_lease = None
+
+        # A batch behind this host's cursor can still expire after the host passed it (its worker died), so go back
+        # for every batch still left in the queue, until all of them are completed
+        while coordinator is not None and not limit_reached:
+            batch_leases = lease_remaining_batches(coordinator, time_limit)
+            if len(batch_leases) == 0:
+                break
+            limit_reached, batches_completed = reclaim_batches(batch_leases, out_file, output_columns, scrape_row,
+                                                               journal, coordinator, run_timer, reached_limit)
+            metrics['batches_completed'] += batches_completed
 
         logger.info('Scrape completed without error.')
 
@@ -419,38 +807,85 @@ def main(config_path, site, environment, limit_rows=None, limit_minutes=None, li
         except WebDriverException as e:
             logger.error('Unable to save screenshot. {}'.format(e))
 
-    # Close the browser
-    if scraper and auto_close:
-        scraper.close()
+    if journal is not None:
+        journal.close()
+
+    if segment_uploader is not None:
+        segment_uploader.stop()
+        metrics['segments_uploaded'] = segment_uploader.segments_uploaded
+
+    # Searches the workers finished ahead of the writer are kept, so a --resume doesn't load their reports again
+    if scraper_pool is not None:
+        scraper_pool.stop()
+        if search_cache is not None:
+            for (first_name, last_name, city, state), contact_info in scraper_pool.unclaimed_results().items():
+                search_cache.put(site, first_name, last_name, city, state, contact_info)
+
+    if metrics_server is not None:
+        metrics_server.stop()
+
+    # Close the browser(s)
+    if auto_close:
+        for open_scraper in scrapers:
+            open_scraper.close()
+
+    if search_cache is not None:
+        search_cache.close()
 
     # Upload out_file to s3 bucket
     if environment == 'ec2' and path.isfile(out_file):
         object_name = create_s3_object_key(local_file_path=out_file, hostname=hostname)
         try:
             logger.info('Uploading {} to {}/{}'.format(out_file, run_config.upload_bucket, object_name))
-            upload_file(file_name=out_file, bucket=run_config.upload_bucket, object_name=object_name)
+            upload_file(file_name=out_file, bucket=run_config.upload_bucket, object_name=object_name,
+                        endpoint_url=run_config.upload_endpoint_url)
         except ClientError as e:
             logger.exception('S3 upload failed: {}'.format(e))
 
     # Metrics!
     metrics['end_time'] = datetime.now()
     metrics['duration'] = metrics['end_time'] - start_time
-    metrics['reports_loaded'] = scraper.reports_loaded
-    metrics['avg_reports_loaded_per_hour'] = round(metrics['reports_loaded'] /
-                                                   (metrics['duration'].seconds / 60 / 60), 2)
+    metrics['reports_loaded'] = sum(open_scraper.reports_loaded for open_scraper in scrapers)
+    duration_hours = metrics['duration'].total_seconds() / 60 / 60
+    metrics['avg_reports_loaded_per_hour'] = round(metrics['reports_loaded'] / duration_hours, 2) \
+        if duration_hours > 0 else 0
+    if search_cache is not None:
+        metrics['search_cache_hits'] = search_cache.hits
+
+    for open_scraper in scrapers:
+        run_timer.merge(open_scraper.timer)
+    phase_timings = run_timer.summary()
+    metrics_file = run_timer.write_json('{}_metrics.json'.format(path.splitext(out_file)[0]), metrics_dict=metrics)
 
     print(SEP)
     print('Total run time: {}'.format(metrics['duration']))
     print('Total rows processed: {}'.format(metrics['row_count']))
+    if resume:
+        print('Rows restored from journal: {}'.format(metrics['resumed_rows']))
     print('Total rows successfully scraped: {}'.format(metrics['scraped_count']))
     print('Total rows failed to scrape: {}'.format(metrics['failed_count']))
     print('Total reports loaded: {}'.format(metrics['reports_loaded']))
+    print('Total duplicate owner searches saved: {}'.format(metrics['searches_saved']))
+    if search_cache is not None:
+        print('Total searches served from cache: {}'.format(metrics['search_cache_hits']))
+    if coordinator is not None:
+        print('Total batches completed: {}'.format(metrics['batches_completed']))
+    if segment_uploader is not None:
+        print('Total segments uploaded mid-run: {}'.format(metrics['segments_uploaded']))
+
+    print(SEP)
+    print('{:<15}{:>8}{:>12}{:>10}{:>10}{:>10}'.format('Phase', 'Count', 'Total (s)', 'p50', 'p95', 'Max'))
+    for phase, timing in phase_timings.items():
+        print('{:<15}{:>8}{:>12}{:>10}{:>10}{:>10}'.format(phase, timing['count'], timing['total'], timing['p50'],
+                                                           timing['p95'], timing['max']))
+    print('Metrics written to: {}'.format(metrics_file))
 
     # Send email report
     if email_report:
         try:
             reporter = EmailReporter(sender=run_config.email_sender, recipient=run_config.email_recipient)
-            reporter.send_report(metrics_dict=metrics, screenshot=screenshot_path, sample_output_list=logger.cache)
+            reporter.send_report(metrics_dict=metrics, screenshot=screenshot_path, sample_output_list=logger.cache,
+                                 log_json=logger.to_json(), metrics_file=metrics_file)
             logger.info('Report sent to {}'.format(run_config.email_recipient))
         except EmailReporterException as e:
             logger.exception('Failed to send email: {}'.format(e))
@@ -476,6 +911,32 @@ if __name__ == '__main__':
     parser.add_argument('--site', required=True, choices=SUPPORTED_SITES,
                         help='The site to scrape: instantcheckmate.com (ic) or fastpeoplesearch.com (fps)')
     parser.add_argument('--environment', '-e', required=True, choices={'ec2', 'local'})
+    parser.add_argument('--browsers', default=1, type=int,
+                        help='Number of browsers to scrape with in parallel, each with its own Chrome profile')
+    parser.add_argument('--resume', default=False, action='store_true',
+                        help='Continue an interrupted run from its checkpoint journal, without prompting')
+    parser.add_argument('--coordinator', required=False, metavar='URL',
+                        help='Lease rows from a running Coordinator (e.g. http://localhost:8642) '
+                             'instead of using the sheet\'s hostname column')
+    parser.add_argument('--metrics-port', required=False, type=int,
+                        help='Serve live Prometheus-style run metrics at http://localhost:<port>/metrics')
+    parser.add_argument('--dom-extraction', default='page_source', choices=DOM_EXTRACTION_MODES,
+                        help='Read each page from one page_source fetch (default), or element by element over '
+                             'WebDriver as before')
+    parser.add_argument('--reload-search-results', default=False, action='store_true',
+                        help='Reload the search results page after every report and click through to the next one, '
+                             'instead of opening each matched report by its URL')
+    parser.add_argument('--headless', default=False, action='store_true',
+                        help='Run Chrome without a window (overrides the site\'s browser launch settings); only for '
+                             'sites and sessions that need no manual login or Captcha solving')
+    parser.add_argument('--keep-browser', default=False, action='store_true',
+                        help='Leave Chrome running and logged in after the run, and attach to it (or relaunch it on '
+                             'the same profile) on the next --keep-browser run of this site, whatever the config')
+    parser.add_argument('--no-search-cache', default=False, action='store_true',
+                        help='Always scrape, ignoring and not updating the on-disk search result cache')
+    parser.add_argument('--sync-minutes', default=15, type=int,
+                        help='On ec2, upload the rows completed so far to S3 every N minutes while the run is going; '
+                             '0 to only upload the output at the end')
 
     args = parser.parse_args()
 
@@ -487,4 +948,14 @@ if __name__ == '__main__':
          limit_rows=args.limit_rows,
          limit_minutes=args.limit_minutes,
          auto_close=args.auto_close,
-         email_report=args.email_report)
+         email_report=args.email_report,
+         use_search_cache=not args.no_search_cache,
+         resume=args.resume,
+         browsers=args.browsers,
+         coordinator_url=args.coordinator,
+         metrics_port=args.metrics_port,
+         dom_extraction=args.dom_extraction,
+         direct_reports=not args.reload_search_results,
+         headless=args.headless,
+         keep_browser=args.keep_browser,
+         sync_minutes=args.sync_minutes)
@@ -0,0 +1,76 @@
+import csv
+from types import SimpleNamespace
+
+import pytest
+
+from local_ops.SheetManager import SheetManager, JOIN_METHODS
+
+
+def write_csv(file_path, fieldnames, rows):
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def merge(tmp_path, join_method):
+    master = SimpleNamespace(location=str(tmp_path / 'master.csv'), id_column='uid', id_char_count='mixed')
+    child = SimpleNamespace(location=str(tmp_path / 'child.csv'), id_column='child_uid', id_char_count='mixed')
+    manager = SheetManager(master_config=master, child_config=child, overwrite=True, join_method=join_method,
+                           sort_chunk_size=2)
+    manager.merge()
+    with open(manager.out_file, 'r', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize('join_method', JOIN_METHODS)
+def test_child_values_skip_empty_master_columns(tmp_path, join_method):
+    """ The master's own a__1 column stays as it was, even when empty; the child's 'a' goes to a__2 instead """
+    write_csv(tmp_path / 'master.csv', ['uid', 'a', 'a__1'],
+              [{'uid': '1', 'a': 'm1', 'a__1': ''},
+               {'uid': '2', 'a': 'm2', 'a__1': 'kept'},
+               {'uid': '3', 'a': 'm3', 'a__1': ''}])
+    write_csv(tmp_path / 'child.csv', ['child_uid', 'a'],
+              [{'child_uid': '1', 'a': 'c1'},
+               {'child_uid': '2', 'a': 'c2'}])
+
+    rows = merge(tmp_path, join_method)
+
+    assert [row['a__1'] for row in rows] == ['', 'kept', '']
+    assert [row['a__2'] for row in rows] == ['c1', 'c2', '']
+
+
+@pytest.mark.parametrize('join_method', ('hash', 'sort'))
+def test_further_children_skip_master_columns(tmp_path, join_method):
+    """ nested misplaces the second child; see test_children_sharing_an_id """
+    write_csv(tmp_path / 'master.csv', ['uid', 'a', 'a__1'],
+              [{'uid': '1', 'a': 'm1', 'a__1': ''}])
+    write_csv(tmp_path / 'child.csv', ['child_uid', 'a'],
+              [{'child_uid': '1', 'a': 'c1'},
+               {'child_uid': '1', 'a': 'c1b'}])
+
+    rows = merge(tmp_path, join_method)
+
+    assert [(row['a__1'], row['a__2'], row['a__3']) for row in rows] == [('', 'c1', 'c1b')]
+
+
+@pytest.mark.parametrize('join_method', JOIN_METHODS)
+def test_children_sharing_an_id(tmp_path, join_method):
+    """ hash and sort give both children to master 1; nested skips c1b, which ends up in the orphan tail """
+    write_csv(tmp_path / 'master.csv', ['uid', 'a'],
+              [{'uid': '1', 'a': 'm1'},
+               {'uid': '2', 'a': 'm2'}])
+    write_csv(tmp_path / 'child.csv', ['child_uid', 'a'],
+              [{'child_uid': '1', 'a': 'c1'},
+               {'child_uid': '1', 'a': 'c1b'},
+               {'child_uid': '2', 'a': 'c2'}])
+
+    rows = merge(tmp_path, join_method)
+
+    if join_method == 'nested':
+        assert [(row['uid'], row['child_uid'], row['a__1']) for row in rows] == \
+            [('1', '1', 'c1'), ('2', '2', 'c2'), ('', '1', 'c1b')]
+        assert 'a__2' not in rows[0]
+    else:
+        assert [(row['uid'], row['child_uid'], row['a__1'], row['a__2']) for row in rows] == \
+            [('1', '1', 'c1', 'c1b'), ('2', '2', 'c2', '')]